@@ -5,12 +5,17 @@ import os
 
 from modules.ai_selector_gemini import ai_select_stocks_gemini
 from modules.ai_explainer_gemini import ai_market_summary_gemini
-from modules.data_fetcher import fetch_indices_nse, fetch_option_chain, fetch_spot_price
+from modules.market_data import get_provider
+from modules.chain_archive import ChainArchive
+from modules.resilience import ResilientFetcher
+from modules.shm_snapshot import SnapshotReader
 from modules.analytics import compute_core_metrics
+from modules.chain_columns import columns_digest
 from modules.strategy_engine import build_strategies
 from modules.backtester import run_detailed_backtest
-from modules.ai_trade_levels import ai_trade_levels
+from modules.ai_trade_levels import compute_trade_levels, market_frame
 from modules.charts import plot_iv_rank_history, plot_expected_move_chart
+from modules import perf_trace
 
 import streamlit.components.v1 as components
 
@@ -163,6 +168,21 @@ with st.sidebar:
       st.info("Groww integration is simulated (no live API). Orders will be logged as paper trades.")
 
 
+    st.markdown("### 📡 Market Data")
+    source_kinds = ["nse", "kite", "replay", "shared"]
+    env_source = os.getenv("MARKET_DATA_PROVIDER", "nse").lower()
+    data_source = st.selectbox("Data Source", ["NSE Live", "Kite Quotes", "Replay", "Shared Refresher"],
+                               index=source_kinds.index(env_source) if env_source in source_kinds else 0,
+                               help="Shared Refresher reads snapshots published by `python -m modules.refresher`.")
+    replay_path, replay_speed, record_dir = None, None, None
+    if data_source == "Replay":
+        replay_path = st.text_input("Snapshot file / folder", os.getenv("MARKET_DATA_REPLAY", os.path.join("data", "recordings")))
+        replay_speed = st.number_input("Replay speed (0 = step per refresh)", 0.0, 3600.0, 0.0, step=1.0)
+    elif data_source != "Shared Refresher" and st.checkbox("⏺️ Record responses for replay", value=bool(os.getenv("MARKET_DATA_RECORD"))):
+        record_dir = os.getenv("MARKET_DATA_RECORD") or os.path.join("data", "recordings")
+    archive_chain = st.checkbox("🗄️ Archive chain snapshots", value=bool(os.getenv("CHAIN_ARCHIVE")),
+                                help="Keep every option-chain refresh (delta-encoded) for intraday OI/IV analysis.")
+
     default_universe = ["BANKNIFTY", "NIFTY", "RELIANCE", "HDFCBANK", "ICICIBANK"]
     symbol = st.selectbox("📊 Select Universe (Index or Stock)", options=default_universe, index=0)
 
@@ -173,8 +193,31 @@ with st.sidebar:
     expiry_days = st.slider("Days to Expiry (Estimate)", 1, 45, 15)
 
     st.markdown("---")
+    show_perf = st.checkbox("⏱️ Performance Panel", value=perf_trace.is_enabled(),
+                            help="Time each stage (NSE fetch, analytics, Gemini, charts, orders).")
+    # tracing is process-wide: the box turns it on, unticking only hides this session's panel
+    if show_perf:
+        perf_trace.enable()
     run_ai = st.button("🚀 Run Analysis", use_container_width=True)
 
+
+def render_perf_panel():
+    """Sidebar table of per-stage timings with JSONL / Prometheus exports."""
+    if not show_perf:
+        return
+    with st.sidebar:
+        st.markdown("### ⏱️ Performance")
+        rows = perf_trace.summary()
+        if not rows:
+            st.caption("No spans recorded yet.")
+            return
+        st.dataframe(pd.DataFrame(rows).set_index("stage"), use_container_width=True)
+        c1, c2, c3 = st.columns(3)
+        c1.download_button("JSONL", perf_trace.export_jsonl(), file_name="perf_trace.jsonl", mime="application/json")
+        c2.download_button("Prom", perf_trace.export_prometheus(), file_name="perf_trace.prom", mime="text/plain")
+        if c3.button("Clear"):
+            perf_trace.clear()
+
 # ----------------------------------------------------------------
 # AI Trigger & Market Data Fetch
 # ----------------------------------------------------------------
@@ -205,44 +248,101 @@ selection = st.session_state["ai_selection"][0]
 
 import time
 
-# --- Retry logic for critical market data ---
-def try_fetch_data(symbol, retries=3, delay=2):
+@st.cache_resource(show_spinner=False)
+def load_fetcher(source, replay_path=None, replay_speed=None, record_dir=None, kite_key=None, kite_token=None):
+    kind = {"NSE Live": "nse", "Kite Quotes": "kite", "Replay": "replay"}[source]
+    return ResilientFetcher(get_provider(kind, record=record_dir, path=replay_path, speed=replay_speed or None,
+                                         api_key=kite_key, access_token=kite_token), columnar=True)
+
+@st.cache_resource(show_spinner=False)
+def load_snapshot_reader(symbol):
+    return SnapshotReader(symbol)
+
+shared = data_source == "Shared Refresher"
+if not shared:
+    try:
+        fetcher = load_fetcher(data_source, replay_path, replay_speed, record_dir,
+                               zerodha_api_key if broker == "Zerodha" else None,
+                               zerodha_access_token if broker == "Zerodha" else None)
+    except Exception as e:
+        st.error(f"❌ Could not start {data_source} data source: {str(e)[:150]}")
+        st.stop()
+    provider = fetcher.provider
+
+# --- Per-component fetch: retries with backoff run on background workers; page waits at most FETCH_BUDGET ---
+FETCH_BUDGET = float(os.getenv("FETCH_BUDGET_SECONDS", "4"))
+
+def try_fetch_data(symbol, budget=FETCH_BUDGET):
     status = st.empty()  # placeholder for single-line status updates
+    status.info(f"🔄 Fetching market data ({provider.name})...")
+    with perf_trace.span("app.fetch", symbol=symbol):
+        snap = fetcher.snapshot(symbol, budget=budget)
+
+    indices = snap["indices"].value or {}
+    spot = snap["spot"].value
+    vix = indices.get("INDIAVIX") or indices.get("INDIA VIX")
+    oc = snap["option_chain"].value
+    if not (spot and vix and oc):
+        missing = [name for name, r in snap.items() if not r.value]
+        errors = "; ".join(f"{n}: {snap[n].error}" for n in missing if snap[n].error)
+        status.error(f"❌ No data yet for {', '.join(missing)} ({errors[:150]}). Retrying in the background.")
+        return None, None, None, None, None
+
+    # Recompute metrics (and append IV history) only when the inputs changed
+    key = (symbol, columns_digest(oc), spot, vix, rfr, expiry_days)
+    memo = st.session_state.get("metrics_memo")
+    if memo and memo[0] == key:
+        metrics = memo[1]
+    else:
+        metrics = compute_core_metrics(symbol, spot, vix, oc, r=rfr, days=expiry_days)
+        st.session_state["metrics_memo"] = (key, metrics)
+    pcr = metrics.get("pcr") if metrics else None
+
+    stale = {name: r for name, r in snap.items() if r.stale and r.value}
+    if stale:
+        ages = ", ".join(f"{n} {int(time.time() - r.fetched_at)}s old" for n, r in stale.items() if r.fetched_at)
+        status.warning(f"⚠️ Showing last good data ({ages}) — live refresh is retrying in the background.")
+    elif pcr:
+        status.success(f"✅ Market data fetched successfully (Spot={spot:.2f}, VIX={vix:.2f}, PCR={round(pcr, 2)})")
+    return spot, vix, pcr, oc, metrics
+
+def read_shared_snapshot(symbol):
+    """Attach to the refresher's published snapshot: no fetch and no analytics in this session."""
+    status = st.empty()
+    with perf_trace.span("app.shared_read", symbol=symbol):
+        snap = load_snapshot_reader(symbol).read()
+    if snap is None:
+        status.error(f"❌ No shared snapshot for {symbol}. Start the refresher: "
+                     f"`python -m modules.refresher {symbol} --interval 30`")
+        return None, None, None, None, None
+    extra = snap.meta.get("extra", {})
+    spot, vix, metrics = extra.get("spot"), extra.get("vix"), snap.metrics
+    pcr = metrics.get("pcr")
+    stale = [n for n, v in (extra.get("stale") or {}).items() if v]
+    msg = (f"Shared snapshot from {extra.get('provider', '?')}, {int(snap.age)}s old "
+           f"(r={extra.get('r')}, {extra.get('days')}d expiry estimate)")
+    if stale or snap.age > 3 * float(os.getenv("REFRESHER_INTERVAL", "30")):
+        status.warning(f"⚠️ {msg}" + (f" — stale: {', '.join(stale)}" if stale else " — is the refresher running?"))
+    else:
+        status.success(f"✅ {msg} (Spot={spot:.2f}, VIX={vix:.2f}, PCR={round(pcr, 2) if pcr else '–'})")
+    return spot, vix, pcr, snap.chain_columns(), metrics
 
-    for attempt in range(retries):
-        try:
-            status.info(f"🔄 Attempt {attempt+1}/{retries}: Fetching live market data...")
-
-            indices = fetch_indices_nse()
-            spot = indices.get(symbol.upper()) or fetch_spot_price(symbol)
-            vix = indices.get("INDIAVIX") or indices.get("INDIA VIX")
-            oc = fetch_option_chain(symbol)
-            metrics = compute_core_metrics(symbol, spot, vix, oc, r=rfr, days=expiry_days)
-            pcr = metrics.get("pcr") if metrics else None
-
-            if spot and vix and pcr:
-                status.success(f"✅ Market data fetched successfully (Spot={spot:.2f}, VIX={vix:.2f}, PCR={round(pcr, 2)})")
-                return spot, vix, pcr, oc, metrics
-
-            status.warning(
-                f"⚠️ Attempt {attempt+1}/{retries} failed: Missing data "
-                f"(Spot={spot}, VIX={vix}, PCR={pcr})"
-            )
-            time.sleep(delay)
-
-        except Exception as e:
-            status.error(f"⚠️ Attempt {attempt+1}/{retries} failed: {str(e)[:100]}")
-            time.sleep(delay)
-
-    status.error("❌ Failed to fetch Spot, India VIX, or PCR after multiple retries.")
-    return None, None, None, None, None
+@st.cache_resource(show_spinner=False)
+def load_archive(symbol):
+    return ChainArchive(symbol, root=os.getenv("CHAIN_ARCHIVE_DIR", os.path.join("data", "chain_archive")))
 
 # --- Run safe fetch ---
-spot, vix, pcr, oc, metrics = try_fetch_data(symbol)
+spot, vix, pcr, oc, metrics = read_shared_snapshot(symbol) if shared else try_fetch_data(symbol)
+
+if archive_chain and oc:
+    archive = load_archive(symbol)
+    if archive.append(oc):
+        archive.flush()
 
 # --- Stop if still missing ---
 if not spot or not vix or not pcr:
     st.error("❌ Critical data missing: Unable to fetch Spot, India VIX, or PCR (OI). Please retry later.")
+    render_perf_panel()
     if st.button("🔁 Retry Fetch Data"):
         st.rerun()
     st.stop()
@@ -322,11 +422,8 @@ with tab_backtest:
 # ----------------------------------------------------------------
 with tab_ai_levels:
     st.subheader("⚙️ AI Entry, Exit & Stop-Loss")
-    ai_levels = []
-    for strat in strategies:
-        ai_level = ai_trade_levels(symbol, spot, metrics.get("atm_iv_rank", 50), metrics.get("pcr", 1.0), strat["Strategy"])
-        ai_levels.append(ai_level)
-    st.dataframe(pd.DataFrame(ai_levels), use_container_width=True)
+    ai_levels = compute_trade_levels(market_frame({symbol: metrics}), [strat["Strategy"] for strat in strategies])
+    st.dataframe(ai_levels, use_container_width=True)
 
 # ----------------------------------------------------------------
 # TAB 5: AI Market Summary
@@ -335,3 +432,5 @@ with tab_summary:
     st.subheader("🧠 AI Summary & Insights")
     st.write(st.session_state["ai_summary"])
     st.caption("⚠️ Educational use only. Not financial advice.")
+
+render_perf_panel()
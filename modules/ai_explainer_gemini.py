@@ -1,6 +1,8 @@
 import os
 import google.generativeai as genai
+from .perf_trace import span, traced
 
+@traced()
 def ai_market_summary_gemini(selection: list):
     api_key = os.getenv("GEMINI_API_KEY")
     if not api_key:
@@ -12,4 +14,7 @@ def ai_market_summary_gemini(selection: list):
 based on these AI‑selected opportunities (JSON): {selection}.
 Keep to 6–8 bullet points, neutral tone, include IV/VIX cautions and event risk.
 """
-    return model.generate_content(prompt).text
+    with span("gemini.generate", model="gemini-3-pro-preview") as sp:
+        text = model.generate_content(prompt).text
+        sp.set(bytes=len(text or ""))
+    return text
@@ -1,11 +1,14 @@
 import os, json, re
 import google.generativeai as genai
 from google.api_core import exceptions
+from .perf_trace import span, traced
 
 def _call_gemini(prompt):
     try:
-        model = genai.GenerativeModel("gemini-flash-lite-latest")
-        resp = model.generate_content(prompt)
+        with span("gemini.generate", model="gemini-flash-lite-latest") as sp:
+            model = genai.GenerativeModel("gemini-flash-lite-latest")
+            resp = model.generate_content(prompt)
+            sp.set(bytes=len(resp.text or ""))
         return resp.text
     except exceptions.ResourceExhausted:
         return "[AI Error] Gemini API quota exhausted. Try again later or use cached analysis."
@@ -14,6 +17,7 @@ def _call_gemini(prompt):
     except Exception as e:
         return f"[AI Error] Unexpected: {str(e)[:120]}"
         
+@traced()
 def ai_select_stocks_gemini(symbols: list):
     prompt = f"""You are an expert option-seller in Indian markets.
 Given this universe: {', '.join(symbols)},
@@ -1,52 +1,148 @@
-import random
+from collections import OrderedDict
+import threading
+import numpy as np
+import pandas as pd
 
-def ai_trade_levels(symbol, spot, iv_rank, pcr, strategy="Iron Condor"):
+from .perf_trace import span
+
+# -------------------------------------------------------------
+# Chain-aware entry / exit / stop-loss levels
+# -------------------------------------------------------------
+# Levels come from the chain's OI walls (heaviest PE OI below spot = support,
+# heaviest CE OI above spot = resistance), the skew-aware expected-move band and
+# IV rank / PCR. Every (symbol, strategy) pair is computed in one vectorized pass
+# and the result is cached per market snapshot, so reruns give identical levels.
+
+MARKET_COLUMNS = ["Symbol", "spot", "iv_rank", "pcr", "put_wall", "call_wall", "em_lo", "em_hi"]
+SELL_PREMIUM = ("Iron Condor", "Bull Put Credit Spread")
+RATIONALE = {
+    "Iron Condor": "Neutral view, shorts outside the expected-move band and behind the OI walls.",
+    "Bull Put Credit Spread": "Bullish bias, enter on dips toward put OI support; exit near call OI resistance.",
+    "ATM Calendar": "Expect short-term stability with long-term IV mean reversion.",
+}
+DEFAULT_RATIONALE = "Range from expected-move band and OI walls."
+LEVEL_COLUMNS = ["Symbol", "Strategy", "Entry", "Exit Target", "Stop Loss", "Support (PE OI)", "Resistance (CE OI)",
+                 "AI Confidence (%)", "Volatility Insight", "PCR Insight", "Rationale"]
+
+_CACHE = OrderedDict()
+_CACHE_MAX = 64
+_CACHE_LOCK = threading.Lock()
+
+
+def market_frame(snapshots):
+    """
+    One row per symbol from {symbol: metrics} as returned by compute_core_metrics
+    (spot, atm_iv_rank, pcr, put_wall, call_wall, skew_band_3d / expected_move_3d).
+    """
+    rows = []
+    for symbol, m in snapshots.items():
+        spot = m.get("spot")
+        lo, hi = m.get("skew_band_3d") or (None, None)
+        if lo is None and spot and isinstance(m.get("expected_move_3d"), tuple) and m["expected_move_3d"][0]:
+            lo, hi = spot - m["expected_move_3d"][0], spot + m["expected_move_3d"][0]
+        rows.append((symbol, spot, m.get("atm_iv_rank"), m.get("pcr"), m.get("put_wall"), m.get("call_wall"), lo, hi))
+    return pd.DataFrame(rows, columns=MARKET_COLUMNS)
+
+
+def _frame_key(df):
+    # hash_pandas_object hashes NaN consistently (raw tuples never match: nan != nan)
+    return tuple(df.columns), len(df), pd.util.hash_pandas_object(df, index=False).to_numpy().tobytes()
+
+
+def _snapshot_key(markets, strategies):
+    return (_frame_key(markets),
+            _frame_key(strategies) if isinstance(strategies, pd.DataFrame) else tuple(strategies))
+
+
+def compute_trade_levels(markets, strategies):
     """
-    AI-based entry, exit, and stop-loss generator.
-    You can connect Gemini API here for more sophistication.
+    Levels for every symbol x strategy.
+    :param markets: DataFrame with MARKET_COLUMNS (see market_frame)
+    :param strategies: list of strategy names (applied to every symbol) or a DataFrame of (Symbol, Strategy) pairs
+    :return: DataFrame with LEVEL_COLUMNS
     """
-    levels = {}
-
-    # ---- Adjust logic based on strategy type ----
-    if strategy == "Iron Condor":
-        # Wider range, neutral bias
-        entry = round(spot, -2)  # nearest 100
-        stop = round(entry * 0.98, 2)
-        target = round(entry * 1.02, 2)
-        rationale = "Neutral view, sell premium near expected move band."
-    elif strategy == "Bull Put Credit Spread":
-        # Bullish bias
-        entry = round(spot * 0.99, 2)
-        stop = round(entry * 0.985, 2)
-        target = round(entry * 1.01, 2)
-        rationale = "Bullish bias, strong put OI support zone."
-    elif strategy == "ATM Calendar":
-        # Volatility play
-        entry = round(spot, 2)
-        stop = round(entry * 0.99, 2)
-        target = round(entry * 1.01, 2)
-        rationale = "Expect short-term stability with long-term IV mean reversion."
+    key = _snapshot_key(markets, strategies)
+    with _CACHE_LOCK:
+        hit = _CACHE.get(key)
+        if hit is not None:
+            _CACHE.move_to_end(key)
+    with span("trade_levels.compute", rows=len(markets), cache_hit=hit is not None):
+        if hit is not None:
+            return hit.copy()
+        out = _compute(markets, strategies)
+    with _CACHE_LOCK:
+        _CACHE[key] = out
+        while len(_CACHE) > _CACHE_MAX:
+            _CACHE.popitem(last=False)
+    return out.copy()
+
+
+def _filled(col, default):
+    v = pd.to_numeric(col, errors="coerce").to_numpy(dtype=float)
+    return np.where(np.isnan(v), default, v)
+
+
+def _compute(markets, strategies):
+    if isinstance(strategies, pd.DataFrame):
+        df = strategies[["Symbol", "Strategy"]].merge(markets, on="Symbol", how="inner")
     else:
-        entry = spot
-        stop = round(spot * 0.985, 2)
-        target = round(spot * 1.015, 2)
-        rationale = "AI-generated default range based on spot trend."
-
-    # Add AI-based adjustment factors (mocked for now)
-    ai_confidence = random.randint(70, 95)
-    iv_factor = "High IV — safer to sell options" if iv_rank > 60 else "Low IV — prefer buying premium"
-    pcr_signal = "PCR > 1 → bullish bias" if pcr > 1 else "PCR < 1 → bearish bias"
-
-    levels = {
-        "Symbol": symbol,
-        "Strategy": strategy,
-        "Entry": entry,
-        "Exit Target": target,
-        "Stop Loss": stop,
-        "AI Confidence (%)": ai_confidence,
-        "Volatility Insight": iv_factor,
-        "PCR Insight": pcr_signal,
-        "Rationale": rationale
-    }
-
-    return levels
+        df = markets.merge(pd.DataFrame({"Strategy": list(strategies)}), how="cross")
+    if df.empty:
+        return pd.DataFrame(columns=LEVEL_COLUMNS)
+
+    spot = _filled(df["spot"], 0.0)
+    iv_rank = _filled(df["iv_rank"], 50.0)
+    pcr = _filled(df["pcr"], 1.0)
+    # bands default to ±1.5% of spot when IV was unavailable; walls default to the band edges
+    em_lo = _filled(df["em_lo"], spot * 0.985)
+    em_hi = _filled(df["em_hi"], spot * 1.015)
+    put_wall = _filled(df["put_wall"], em_lo)
+    call_wall = _filled(df["call_wall"], em_hi)
+    half_band = np.maximum((em_hi - em_lo) / 2.0, spot * 0.001)
+    support = np.maximum(put_wall, em_lo)       # nearest of wall / band below spot
+    resistance = np.minimum(call_wall, em_hi)   # nearest of wall / band above spot
+    floor = np.minimum(put_wall, em_lo)         # outer of wall / band below spot
+    ceiling = np.maximum(call_wall, em_hi)      # outer of wall / band above spot
+
+    strat = df["Strategy"].to_numpy()
+    is_ic = strat == "Iron Condor"
+    is_bp = strat == "Bull Put Credit Spread"
+    is_cal = strat == "ATM Calendar"
+    conds = [is_ic, is_bp, is_cal]
+
+    entry = np.select(conds, [spot, (spot + support) / 2.0, spot], default=spot)
+    stop = np.select(conds, [floor, floor - 0.25 * half_band, spot - 0.5 * (spot - em_lo)], default=em_lo)
+    target = np.select(conds, [ceiling, resistance, spot + 0.5 * (em_hi - spot)], default=em_hi)
+
+    # Confidence: IV regime fit + PCR alignment + room between the OI walls relative to the band
+    sells = np.isin(strat, SELL_PREMIUM)
+    iv_fit = np.where(sells, iv_rank - 50.0, np.where(is_cal, 50.0 - iv_rank, 0.0)) * 0.2
+    pcr_fit = np.select([is_bp, is_ic], [np.clip(pcr - 1.0, -1, 1) * 10.0, -np.minimum(np.abs(pcr - 1.0), 1.0) * 10.0], 0.0)
+    room = np.clip((call_wall - put_wall) / np.maximum(em_hi - em_lo, 1e-9), 0.0, 2.0)
+    room_fit = np.where(sells, (room - 1.0) * 5.0, 0.0)
+    confidence = np.clip(np.rint(72.0 + iv_fit + pcr_fit + room_fit), 50, 95).astype(int)
+
+    return pd.DataFrame({
+        "Symbol": df["Symbol"].to_numpy(),
+        "Strategy": strat,
+        "Entry": np.round(entry, 2),
+        "Exit Target": np.round(target, 2),
+        "Stop Loss": np.round(stop, 2),
+        # blank (NaN) when the chain had no OI wall; the levels above fall back to the band edges
+        "Support (PE OI)": np.round(pd.to_numeric(df["put_wall"], errors="coerce").to_numpy(dtype=float), 2),
+        "Resistance (CE OI)": np.round(pd.to_numeric(df["call_wall"], errors="coerce").to_numpy(dtype=float), 2),
+        "AI Confidence (%)": confidence,
+        "Volatility Insight": np.where(iv_rank > 60, "High IV — safer to sell options", "Low IV — prefer buying premium"),
+        "PCR Insight": np.where(pcr > 1, "PCR > 1 → bullish bias", "PCR < 1 → bearish bias"),
+        "Rationale": [RATIONALE.get(s, DEFAULT_RATIONALE) for s in strat],
+    }, columns=LEVEL_COLUMNS)
+
+
+def ai_trade_levels(symbol, spot, iv_rank, pcr, strategy="Iron Condor", metrics=None):
+    """
+    Single-row convenience wrapper around compute_trade_levels (kept for existing callers).
+    Pass `metrics` from compute_core_metrics to use the chain's OI walls and expected-move band.
+    """
+    m = dict(metrics or {})
+    m.update({"spot": spot, "atm_iv_rank": iv_rank, "pcr": pcr})
+    return compute_trade_levels(market_frame({symbol: m}), [strategy]).iloc[0].to_dict()
@@ -1,12 +1,17 @@
 import math, json, os
+import numpy as np
 from .greeks import greeks
+from .vol_surface import fit_surface, VolSurface
+from .perf_trace import traced
 
 def extract_atm_strike(spot: float, step: int = 100):
     if not spot: return None
     return int(round(spot/step)*step)
 
+@traced()
 def parse_chain(oc:dict):
-    if not oc: return {"pcr":None,"max_pain":None,"strike_iv":{},"top_oi":[]}
+    if not oc: return {"pcr":None,"max_pain":None,"strike_iv":{},"top_oi":[],"strike_oi":{}}
+    if "strike" in oc: return _parse_columns(oc)
     data = oc.get("records",{}).get("data",[])
     ce_oi=pe_oi=0; strike_oi={}; strike_iv={}
     for row in data:
@@ -30,7 +35,45 @@ def parse_chain(oc:dict):
         tot = (v.get("CE",0) or 0)+(v.get("PE",0) or 0)
         if tot>max_tot: max_tot=tot; max_pain=k
     top_oi = sorted(strike_oi.items(), key=lambda kv: (kv[1]["CE"]+kv[1]["PE"]), reverse=True)[:5]
-    return {"pcr":pcr,"max_pain":max_pain,"strike_iv":strike_iv,"top_oi":top_oi}
+    return {"pcr":pcr,"max_pain":max_pain,"strike_iv":strike_iv,"top_oi":top_oi,"strike_oi":strike_oi}
+
+def _num(v):
+    return int(v) if float(v).is_integer() else v
+
+def _parse_columns(cols:dict):
+    """parse_chain for chain_columns arrays (same output, strikes in first-seen order)."""
+    strike, side = cols["strike"], cols["side"]
+    if not len(strike): return parse_chain(None)
+    keys, first, inv = np.unique(strike, return_index=True, return_inverse=True)
+    order = np.argsort(first, kind="stable")
+    oi = np.nan_to_num(cols["oi"])
+    ce = np.bincount(inv, weights=np.where(side==0, oi, 0.0), minlength=len(keys))[order]
+    pe = np.bincount(inv, weights=np.where(side==1, oi, 0.0), minlength=len(keys))[order]
+    ks = [_num(k) for k in keys[order].tolist()]
+    strike_oi = {k:{"CE":_num(c),"PE":_num(p)} for k,c,p in zip(ks, ce.tolist(), pe.tolist())}
+    # last quoted IV per (strike, side), as the row-by-row parse leaves it
+    rank = np.empty(len(keys), dtype=np.int64); rank[order] = np.arange(len(keys))
+    strike_iv = {}
+    iv = cols["iv"]
+    for s, name in enumerate(("CE","PE")):
+        rows = np.flatnonzero((side==s) & ~np.isnan(iv))
+        last = np.full(len(keys), -1); np.maximum.at(last, inv[rows], rows)
+        for j in np.flatnonzero(last>=0).tolist():
+            strike_iv.setdefault(ks[rank[j]],{})[name] = float(iv[last[j]])
+    ce_oi, pe_oi = float(ce.sum()), float(pe.sum())
+    tot = ce+pe
+    top = np.argsort(-tot, kind="stable")[:5].tolist()
+    return {"pcr":(pe_oi/ce_oi) if ce_oi else None,"max_pain":ks[int(np.argmax(tot))],"strike_iv":strike_iv,
+            "top_oi":[(ks[i],strike_oi[ks[i]]) for i in top],"strike_oi":strike_oi}
+
+def oi_walls(strike_oi:dict, spot:float):
+    """(put_wall, call_wall): heaviest PE OI strike at/below spot and heaviest CE OI strike at/above spot."""
+    if not strike_oi or not spot: return None, None
+    puts = [(v.get("PE",0) or 0, k) for k,v in strike_oi.items() if k is not None and k<=spot]
+    calls = [(v.get("CE",0) or 0, k) for k,v in strike_oi.items() if k is not None and k>=spot]
+    put_wall = max(puts)[1] if puts and max(puts)[0]>0 else None
+    call_wall = max(calls)[1] if calls and max(calls)[0]>0 else None
+    return put_wall, call_wall
 
 def compute_atm_iv(strike_iv:dict, spot:float, step:int=100):
     if not strike_iv or not spot: return None
@@ -47,6 +90,18 @@ def expected_move(spot, iv, days):
     move = spot*iv*math.sqrt(days/365.0); pct=(move/spot)*100
     return move, pct
 
+def skew_expected_move(spot, surface, days, passes=2):
+    """(lower, upper) 1σ band using the smile IV at each band edge instead of ATM IV."""
+    if not spot or not surface or days<=0: return None, None
+    t = days/365.0
+    iv0 = surface.atm_iv(T=t)
+    lo = hi = spot*iv0*math.sqrt(t)
+    for _ in range(passes):
+        lo = spot*surface.iv(spot-lo, T=t)*math.sqrt(t)
+        hi = spot*surface.iv(spot+hi, T=t)*math.sqrt(t)
+    return spot-lo, spot+hi
+
+@traced()
 def update_iv_history_and_rank(path, vix=None, atm_iv=None):
     try:
         hist = json.load(open(path,"r"))
@@ -67,21 +122,53 @@ def update_iv_history_and_rank(path, vix=None, atm_iv=None):
     except Exception: pass
     return {"vix_rank":vr,"vix_percentile":vp,"atm_iv_rank":ir,"atm_iv_percentile":ip}
 
+@traced()
 def compute_core_metrics(symbol, spot, vix, oc, r=0.07, q=0.0, days=7):
     base = parse_chain(oc)
     atm_iv = compute_atm_iv(base.get("strike_iv"), spot, 100)
+    surface = fit_surface(symbol, oc, spot, r=r, q=q)
+    if atm_iv is None and surface:
+        atm_iv = surface.atm_iv(T=max(days,1)/365.0)
     em1,em1p = expected_move(spot, atm_iv, 1) if atm_iv else (None,None)
     em3,em3p = expected_move(spot, atm_iv, 3) if atm_iv else (None,None)
     # ATM Greeks (approx): T=days/365
     T = max(days,1)/365.0
     atmK = extract_atm_strike(spot, 100) if spot else None
-    if atm_iv and spot and atmK:
+    if surface and spot and atmK:
+        atm_greeks = surface.greeks(atmK, T, call=True, S=spot)  # smile IV at the ATM strike for this tenor
+    elif atm_iv and spot and atmK:
         delta_c, theta_c, vega_c = greeks(spot, atmK, r, q, atm_iv, T, call=True)
         atm_greeks = (delta_c, theta_c, vega_c)
     else:
         atm_greeks = (None, None, None)
-    base.update({"atm_iv":atm_iv,"expected_move_1d":(em1,em1p),"expected_move_3d":(em3,em3p),"atm_greeks":atm_greeks})
+    base.update({"spot":spot,"atm_iv":atm_iv,"expected_move_1d":(em1,em1p),"expected_move_3d":(em3,em3p),"atm_greeks":atm_greeks,
+                 "vol_surface":surface,"skew_band_1d":skew_expected_move(spot, surface, 1),"skew_band_3d":skew_expected_move(spot, surface, 3)})
+    base["put_wall"], base["call_wall"] = oi_walls(base.get("strike_oi"), spot)
     # IV rank store
     ranks = update_iv_history_and_rank(os.path.join("data","iv_history.json"), vix=vix, atm_iv=atm_iv)
     base.update(ranks)
     return base
+
+# -------------------------------------------------------------
+# JSON round-trip for metrics (shared snapshots / refresher)
+# -------------------------------------------------------------
+_TUPLE_KEYS = ("expected_move_1d","expected_move_3d","atm_greeks","skew_band_1d","skew_band_3d")
+
+def metrics_to_json(m:dict):
+    """JSON-safe copy of compute_core_metrics output (int strike keys and the surface survive the round-trip)."""
+    out = {k:v for k,v in m.items() if k!="vol_surface"}
+    surface = m.get("vol_surface")
+    out["vol_surface"] = surface.to_dict() if surface is not None else None
+    out["strike_iv"] = [[k,v] for k,v in (m.get("strike_iv") or {}).items()]
+    out["strike_oi"] = [[k,v] for k,v in (m.get("strike_oi") or {}).items()]
+    return json.dumps(out, default=float)
+
+def metrics_from_json(text):
+    m = json.loads(text)
+    m["strike_iv"] = {k:v for k,v in m.get("strike_iv") or []}
+    m["strike_oi"] = {k:v for k,v in m.get("strike_oi") or []}
+    m["top_oi"] = [tuple(kv) for kv in m.get("top_oi") or []]
+    for k in _TUPLE_KEYS:
+        if isinstance(m.get(k), list): m[k] = tuple(m[k])
+    if m.get("vol_surface"): m["vol_surface"] = VolSurface.from_dict(m["vol_surface"])
+    return m
@@ -0,0 +1,408 @@
+import os, json, time, hashlib, itertools
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from statistics import NormalDist
+import numpy as np
+import pandas as pd
+
+from .perf_trace import span
+
+# -------------------------------------------------------------
+# Parallel parameter sweeps for premium-selling backtests
+# -------------------------------------------------------------
+#   python -m modules.backtest_sweep --market data/nifty_daily.csv --out data/sweeps/nifty.jsonl
+#
+# Daily market history (date, close, iv) is written once as .npy files; every
+# worker maps them read-only (np.load(mmap_mode="r")), so the pool shares one copy
+# of the data and only small param dicts / result dicts cross process boundaries.
+# Each finished chunk is appended to a JSON-lines file; rerunning with the same
+# --out skips parameter sets already on disk. The file's first line fingerprints
+# the market arrays and the r / capital / strike_step settings, and a rerun
+# against different inputs is refused instead of mixing results.
+#
+# Per parameter set: enter on `weekday` (-1 = every day), one position at a time,
+# sell the `short_delta` strike(s) with `wing_pct` % wide wings expiring `dte`
+# calendar days out, mark the spread daily with Black-Scholes at the day's IV, exit
+# at expiry or when the spread costs `stop_mult` x the credit (0 = no stop), and
+# size each trade so max loss = `risk_pct` % of capital.
+
+MARKET_FILES = ("date", "close", "iv", "weekday")
+GRID_AXES = ("strategy", "wing_pct", "short_delta", "dte", "weekday", "stop_mult", "risk_pct")
+DEFAULT_GRID = {
+    "strategy": ["iron_condor", "put_credit"],
+    "wing_pct": [1.0, 2.0, 3.0],
+    "short_delta": [0.10, 0.15, 0.20, 0.25, 0.30],
+    "dte": [7, 14, 21, 30, 45],
+    "weekday": [0, 1, 2, 3, 4],
+    "stop_mult": [0.0, 1.5, 2.0, 3.0],
+    "risk_pct": [0.5, 1.0, 1.5, 2.0],
+}
+SUMMARY_COLUMNS = ["Trades", "Return (%)", "Max DD (%)", "POP (%)", "Avg P/L (₹)", "Worst P/L (₹)"]
+
+_MARKET = None
+_SETTINGS = None
+
+
+# -------------------------------------------------------------
+# Market data
+# -------------------------------------------------------------
+def parse_dates(values, dayfirst=True):
+    """
+    ISO dates (2024-01-05) are parsed as ISO; `dayfirst` only applies to other
+    formats (05-01-2024, 05-Jan-2024). Raises ValueError on unparseable or duplicate dates.
+    """
+    raw = pd.Series(values).astype(str).str.strip()
+    iso = raw.str.match(r"^\d{4}-\d{2}-\d{2}")
+    dates = pd.Series(pd.NaT, index=raw.index, dtype="datetime64[ns]")
+    if iso.any():
+        dates[iso] = pd.to_datetime(raw[iso], format="ISO8601", errors="coerce")
+    if (~iso).any():
+        dates[~iso] = pd.to_datetime(raw[~iso], format="mixed", dayfirst=dayfirst, errors="coerce")
+    bad = raw[dates.isna()]
+    if len(bad):
+        raise ValueError(f"{len(bad)} unparseable date(s), e.g. {bad.head(3).tolist()}")
+    dup = raw[dates.duplicated(keep=False)]
+    if len(dup):
+        raise ValueError(f"dates collide after parsing, e.g. {dup.head(4).tolist()}")
+    return dates
+
+
+def load_market_csv(path, dayfirst=True):
+    """date, close and iv (decimal or %) or vix (%) columns; other columns are ignored."""
+    df = pd.read_csv(path, dtype={"date": str})
+    df.columns = [c.strip().lower() for c in df.columns]
+    vol_col = "iv" if "iv" in df.columns else "vix"
+    out = pd.DataFrame({"date": parse_dates(df["date"], dayfirst), "close": df["close"], "iv": df[vol_col]})
+    out = out.dropna(subset=["close"]).sort_values("date")
+    out["iv"] = out["iv"].ffill().bfill()
+    if vol_col == "vix" or out["iv"].median() > 2:
+        out["iv"] = out["iv"] / 100.0
+    return out.reset_index(drop=True)
+
+
+def synthetic_market(days=2500, spot=18000.0, seed=0, end="2025-12-31"):
+    """
+    GBM closes with a mean-reverting IV that jumps on down days (benchmarks and smoke runs).
+    The fixed `end` date keeps the series, and so the sweep fingerprint, stable between runs.
+    """
+    rng = np.random.default_rng(seed)
+    dates = pd.bdate_range(end=pd.Timestamp(end), periods=days)
+    iv = np.empty(days)
+    ret = np.empty(days)
+    iv[0] = 0.14
+    for i in range(days):
+        if i:
+            iv[i] = max(0.08, iv[i - 1] + 0.05 * (0.14 - iv[i - 1]) - 0.5 * min(ret[i - 1], 0) + rng.normal(0, 0.004))
+        ret[i] = rng.normal(0.0003, iv[i] / np.sqrt(252))
+    return pd.DataFrame({"date": dates, "close": spot * np.exp(np.cumsum(ret)), "iv": iv})
+
+
+def prepare_market(df, out_dir):
+    """Write the columns as .npy files for memory-mapping in workers; returns out_dir."""
+    os.makedirs(out_dir, exist_ok=True)
+    days = df["date"].to_numpy(dtype="datetime64[D]").astype(np.int64)
+    cols = {
+        "date": days,
+        "close": df["close"].to_numpy(dtype=np.float64),
+        "iv": df["iv"].to_numpy(dtype=np.float64),
+        "weekday": ((days + 3) % 7).astype(np.int8),  # 1970-01-01 was a Thursday; Monday = 0
+    }
+    for name in MARKET_FILES:
+        np.save(os.path.join(out_dir, f"{name}.npy"), cols[name])
+    return out_dir
+
+
+def open_market(market_dir):
+    return {name: np.load(os.path.join(market_dir, f"{name}.npy"), mmap_mode="r") for name in MARKET_FILES}
+
+
+def _init_worker(market_dir, settings):
+    global _MARKET, _SETTINGS
+    _MARKET = open_market(market_dir)
+    _SETTINGS = settings
+
+
+# -------------------------------------------------------------
+# Vectorized pricing and one-parameter-set evaluation
+# -------------------------------------------------------------
+def _ncdf(x):
+    # Abramowitz-Stegun 7.1.26 (|error| < 1.5e-7), vectorized
+    z = np.abs(x) / np.sqrt(2.0)
+    t = 1.0 / (1.0 + 0.3275911 * z)
+    poly = t * (0.254829592 + t * (-0.284496736 + t * (1.421413741 + t * (-1.453152027 + t * 1.061405429))))
+    erf = 1.0 - poly * np.exp(-z * z)
+    return 0.5 * (1.0 + np.sign(x) * erf)
+
+
+def _bs(S, K, T, sigma, r, call):
+    T = np.maximum(T, 1e-8)
+    sd = sigma * np.sqrt(T)
+    d1 = (np.log(S / K) + (r + 0.5 * sigma * sigma) * T) / sd
+    d2 = d1 - sd
+    disc = K * np.exp(-r * T)
+    if call:
+        return S * _ncdf(d1) - disc * _ncdf(d2)
+    return disc * _ncdf(-d2) - S * _ncdf(-d1)
+
+
+def _spread_value(S, T, sigma, r, strikes, strategy):
+    put_short, put_long, call_short, call_long = strikes
+    value = 0.0
+    if strategy in ("iron_condor", "put_credit"):
+        value = value + _bs(S, put_short, T, sigma, r, False) - _bs(S, put_long, T, sigma, r, False)
+    if strategy in ("iron_condor", "call_credit"):
+        value = value + _bs(S, call_short, T, sigma, r, True) - _bs(S, call_long, T, sigma, r, True)
+    return value
+
+
+def _round(x, step):
+    return np.round(x / step) * step if step else x
+
+
+def evaluate(params, market=None, settings=None):
+    """Backtest one parameter set; returns a JSON-ready result dict."""
+    m = market if market is not None else _MARKET
+    cfg = settings if settings is not None else _SETTINGS
+    r, capital, step = cfg["r"], cfg["capital"], cfg["strike_step"]
+    date, close, iv = m["date"], m["close"], m["iv"]
+    n = len(close)
+    empty = {"params": params, "trades": 0, "return_pct": 0.0, "max_dd_pct": 0.0,
+             "pop_pct": None, "avg_pnl": None, "worst_pnl": None}
+
+    dte = int(params["dte"])
+    entries = np.arange(n) if params["weekday"] < 0 else np.flatnonzero(m["weekday"] == params["weekday"])
+    expiry = date[entries] + dte
+    last = np.searchsorted(date, expiry, side="right") - 1
+    ok = (last > entries) & (expiry <= date[-1])
+    entries, expiry, last = entries[ok], expiry[ok], last[ok]
+    if not len(entries):
+        return empty
+
+    # strikes at entry from the short delta (flat IV at entry), wings as % of spot
+    S0, sig0 = close[entries], iv[entries]
+    T0 = (expiry - date[entries]) / 365.0
+    z = NormalDist().inv_cdf(float(params["short_delta"]))
+    drift = (r + 0.5 * sig0 * sig0) * T0
+    vol = sig0 * np.sqrt(T0)
+    wing = np.maximum(_round(S0 * params["wing_pct"] / 100.0, step), step or S0 * 0.001)
+    put_short = _round(S0 * np.exp(z * vol + drift), step)
+    call_short = _round(S0 * np.exp(-z * vol + drift), step)
+    strikes = (put_short, put_short - wing, call_short, call_short + wing)
+    credit = _spread_value(S0, T0, sig0, r, strikes, params["strategy"])
+
+    # daily marks through expiry: one row per entry, padded to the longest holding window
+    hold = last - entries
+    steps = np.arange(1, hold.max() + 1)
+    idx = np.minimum(entries[:, None] + steps, n - 1)
+    valid = steps <= hold[:, None]
+    T = np.maximum(expiry[:, None] - date[idx], 0) / 365.0
+    marks = _spread_value(close[idx], T, iv[idx], r, tuple(k[:, None] for k in strikes), params["strategy"])
+
+    exit_j = hold - 1
+    if params["stop_mult"] > 0:
+        hit = valid & (marks >= params["stop_mult"] * credit[:, None])
+        stopped = hit.any(axis=1)
+        exit_j = np.where(stopped, hit.argmax(axis=1), exit_j)
+    rows = np.arange(len(entries))
+    exit_value = marks[rows, exit_j]
+    exit_idx = entries + exit_j + 1
+
+    max_loss = np.maximum(wing - credit, wing * 0.01)
+    qty = capital * params["risk_pct"] / 100.0 / max_loss
+    pnl = qty * (credit - exit_value)
+
+    # one position at a time: next entry strictly after the previous exit
+    taken, i = [], 0
+    while i < len(entries):
+        taken.append(i)
+        i = np.searchsorted(entries, exit_idx[i], side="right")
+    pnl = pnl[taken]
+
+    equity = capital + np.cumsum(pnl)
+    peak = np.maximum.accumulate(np.concatenate(([capital], equity)))[1:]
+    return {
+        "params": params,
+        "trades": len(pnl),
+        "return_pct": round(float(pnl.sum() / capital * 100.0), 4),
+        "max_dd_pct": round(float(((equity - peak) / peak).min() * 100.0), 4),
+        "pop_pct": round(float((pnl > 0).mean() * 100.0), 2),
+        "avg_pnl": round(float(pnl.mean()), 2),
+        "worst_pnl": round(float(pnl.min()), 2),
+    }
+
+
+def _evaluate_chunk(chunk):
+    return [evaluate(p) for p in chunk]
+
+
+# -------------------------------------------------------------
+# Grid, resume and the process pool
+# -------------------------------------------------------------
+def param_grid(**axes):
+    """Cartesian product of the axes (missing axes use DEFAULT_GRID) as a list of param dicts."""
+    values = [list(axes.get(a, DEFAULT_GRID[a])) for a in GRID_AXES]
+    return [dict(zip(GRID_AXES, combo)) for combo in itertools.product(*values)]
+
+
+def param_key(params):
+    return json.dumps(params, sort_keys=True)
+
+
+def sweep_fingerprint(market_dir, settings):
+    """sha256 over the market .npy files and the sweep settings."""
+    h = hashlib.sha256()
+    for name in MARKET_FILES:
+        with open(os.path.join(market_dir, f"{name}.npy"), "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                h.update(block)
+    h.update(json.dumps(settings, sort_keys=True).encode())
+    return h.hexdigest()
+
+
+def _read_lines(path):
+    out = []
+    if not os.path.exists(path):
+        return out
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                out.append(json.loads(line))
+            except json.JSONDecodeError:
+                continue
+    return out
+
+
+def read_header(path):
+    """The fingerprint line of a results file, or None (missing file or pre-fingerprint results)."""
+    return next((rec for rec in _read_lines(path) if "fingerprint" in rec), None)
+
+
+def read_results(path):
+    """Results already on disk; a torn last line from an interrupted run is ignored."""
+    return [rec for rec in _read_lines(path) if "params" in rec]
+
+
+def run_sweep(grid, market_dir, out_path, workers=None, chunk_size=None, r=0.07, capital=200000.0, strike_step=50.0):
+    """
+    Evaluate every param dict in `grid` across a process pool, appending results to `out_path`.
+    Parameter sets already in `out_path` are skipped. Raises ValueError if `out_path`
+    holds results for other market data or settings. Returns summary_frame(out_path).
+    """
+    settings = {"r": r, "capital": capital, "strike_step": strike_step}
+    fingerprint = sweep_fingerprint(market_dir, settings)
+    header = read_header(out_path)
+    results = read_results(out_path)
+    if results and (header or {}).get("fingerprint") != fingerprint:
+        found = f"settings {header['settings']}" if header else "no fingerprint"
+        raise ValueError(f"{out_path} was written for different market data or settings ({found}); "
+                         f"use another output file or delete it")
+    done = {param_key(res["params"]) for res in results}
+    todo = [p for p in grid if param_key(p) not in done]
+    workers = workers or os.cpu_count() or 1
+    if todo:
+        os.makedirs(os.path.dirname(out_path) or ".", exist_ok=True)
+        chunk_size = chunk_size or max(1, min(64, len(todo) // (workers * 8) or 1))
+        chunks = [todo[i:i + chunk_size] for i in range(0, len(todo), chunk_size)]
+        # a line cut off by an interrupt must not swallow the first new result
+        torn = results and not _ends_with_newline(out_path)
+        # with no results on disk yet the file is started over, fingerprint line first
+        with span("sweep.run", rows=len(todo)), open(out_path, "a" if results else "w", encoding="utf-8") as out, \
+                ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                    initargs=(market_dir, settings)) as pool:
+            if torn:
+                out.write("\n")
+            if not results:
+                out.write(json.dumps({"fingerprint": fingerprint, "settings": settings}) + "\n")
+            for fut in as_completed([pool.submit(_evaluate_chunk, c) for c in chunks]):
+                out.write("".join(json.dumps(res) + "\n" for res in fut.result()))
+                out.flush()
+    return summary_frame(out_path)
+
+
+def _ends_with_newline(path):
+    with open(path, "rb") as f:
+        f.seek(-1, os.SEEK_END)
+        return f.read(1) == b"\n"
+
+
+def summary_frame(results):
+    """One row per parameter set with return, drawdown and POP, best return first."""
+    if isinstance(results, str):
+        results = read_results(results)
+    if not results:
+        return pd.DataFrame(columns=list(GRID_AXES) + SUMMARY_COLUMNS)
+    df = pd.DataFrame([res["params"] for res in results])
+    df["Trades"] = [res["trades"] for res in results]
+    df["Return (%)"] = [res["return_pct"] for res in results]
+    df["Max DD (%)"] = [res["max_dd_pct"] for res in results]
+    df["POP (%)"] = [res["pop_pct"] for res in results]
+    df["Avg P/L (₹)"] = [res["avg_pnl"] for res in results]
+    df["Worst P/L (₹)"] = [res["worst_pnl"] for res in results]
+    df = df.drop_duplicates(subset=list(GRID_AXES), keep="last")
+    return df.sort_values("Return (%)", ascending=False).reset_index(drop=True)
+
+
+# -------------------------------------------------------------
+# CLI
+# -------------------------------------------------------------
+def _main(argv=None):
+    import argparse
+
+    ap = argparse.ArgumentParser(prog="python -m modules.backtest_sweep")
+    src = ap.add_mutually_exclusive_group(required=True)
+    src.add_argument("--market", help="CSV with date, close and iv (or vix) columns")
+    src.add_argument("--synthetic", type=int, metavar="DAYS", help="generate a synthetic daily history instead")
+    ap.add_argument("--dayfirst", action=argparse.BooleanOptionalAction, default=True,
+                    help="read non-ISO dates as DD-MM-YYYY (default) or MM-DD-YYYY (--no-dayfirst)")
+    ap.add_argument("--synthetic-end", default="2025-12-31", help="last date of the --synthetic history")
+    ap.add_argument("--market-dir", default=os.path.join("data", "sweeps", "market"))
+    ap.add_argument("--out", default=os.path.join("data", "sweeps", "results.jsonl"))
+    ap.add_argument("--workers", type=int, default=None)
+    ap.add_argument("--limit", type=int, default=0, help="only the first N parameter sets")
+    ap.add_argument("--scaling", action="store_true", help="time the grid at 1, 2, 4 ... workers (results not kept)")
+    ap.add_argument("--top", type=int, default=20)
+    ap.add_argument("--rate", type=float, default=0.07)
+    ap.add_argument("--capital", type=float, default=200000.0)
+    ap.add_argument("--strike-step", type=float, default=50.0)
+    for axis in GRID_AXES:
+        kind = str if axis == "strategy" else int if axis in ("dte", "weekday") else float
+        ap.add_argument(f"--{axis.replace('_', '-')}", type=kind, nargs="+", default=DEFAULT_GRID[axis])
+    args = ap.parse_args(argv)
+
+    try:
+        df = load_market_csv(args.market, args.dayfirst) if args.market else \
+            synthetic_market(args.synthetic, end=args.synthetic_end)
+    except ValueError as e:
+        ap.error(f"{args.market or '--synthetic'}: {e}")
+    market_dir = prepare_market(df, args.market_dir)
+    grid = param_grid(**{a: getattr(args, a) for a in GRID_AXES})
+    if args.limit:
+        grid = grid[:args.limit]
+    kwargs = {"r": args.rate, "capital": args.capital, "strike_step": args.strike_step}
+    print(f"[sweep] {len(grid)} parameter sets over {len(df)} days ({df['date'].iloc[0]:%Y-%m-%d} → {df['date'].iloc[-1]:%Y-%m-%d})")
+
+    if args.scaling:
+        import tempfile
+        max_workers = args.workers or os.cpu_count() or 1
+        counts = sorted({1, max_workers} | {2 ** i for i in range(1, max_workers.bit_length()) if 2 ** i < max_workers})
+        base = None
+        for w in counts:
+            with tempfile.TemporaryDirectory() as tmp:
+                t0 = time.perf_counter()
+                run_sweep(grid, market_dir, os.path.join(tmp, "r.jsonl"), workers=w, **kwargs)
+                el = time.perf_counter() - t0
+            base = base or el
+            print(f"[sweep] workers={w:>3}  {el:7.2f}s  {len(grid) / el:8.0f} sets/s  speedup x{base / el:.2f}")
+        return
+
+    t0 = time.perf_counter()
+    try:
+        summary = run_sweep(grid, market_dir, args.out, workers=args.workers, **kwargs)
+    except ValueError as e:
+        ap.error(str(e))
+    print(f"[sweep] done in {time.perf_counter() - t0:.2f}s -> {args.out}")
+    with pd.option_context("display.width", 200, "display.max_columns", 20):
+        print(summary.head(args.top).to_string(index=False))
+
+
+if __name__ == "__main__":
+    _main()
@@ -0,0 +1,269 @@
+import os, json, time, bisect, threading, datetime as dt
+from collections import OrderedDict
+import numpy as np
+
+from .chain_columns import FIELDS, chain_to_columns, columns_to_chain, expiry_date
+from .perf_trace import span
+
+# -------------------------------------------------------------
+# Intraday option-chain archive
+# -------------------------------------------------------------
+# Layout: <root>/<SYMBOL>/<YYYY-MM-DD>/index.json + chunk_00000.npz, chunk_00001.npz, ...
+# A chunk holds up to `chunk_size` consecutive snapshots over a shared key table
+# (strike, expiry, side). Every field is stored as a fixed-point int64 matrix
+# [snapshot, key], delta-encoded along time (row 0 is the keyframe), as its own
+# compressed npz member, so a single field of a single chunk can be decoded alone.
+# Keys absent from a snapshot hold MISSING; deltas wrap in int64 and cumsum undoes them.
+
+MISSING = np.iinfo(np.int64).min
+SCALE = {"oi": 1, "chg_oi": 1, "iv": 100, "ltp": 100, "bid": 100, "ask": 100, "volume": 1}
+
+
+def _encode(values, scale):
+    out = np.full(len(values), MISSING, dtype=np.int64)
+    ok = ~np.isnan(values)
+    out[ok] = np.rint(values[ok] * scale).astype(np.int64)
+    return out
+
+
+def _decode(ints, scale):
+    out = ints.astype(np.float64) / scale
+    out[ints == MISSING] = np.nan
+    return out
+
+
+def _stamp(ts):
+    return dt.datetime.fromtimestamp(float(ts)).strftime("%d-%b-%Y %H:%M:%S")
+
+
+def _delta(mat):
+    d = mat.copy()
+    d[1:] = mat[1:] - mat[:-1]
+    return d
+
+
+class ChainArchive:
+    """Append-only writer and point-in-time / per-strike reader for one symbol."""
+
+    def __init__(self, symbol, root=os.path.join("data", "chain_archive"), chunk_size=64, cache_chunks=8):
+        self.symbol = symbol.upper()
+        self.root = os.path.join(root, self.symbol)
+        self.chunk_size = chunk_size
+        self._lock = threading.Lock()
+        self._cache = OrderedDict()
+        self._cache_chunks = cache_chunks
+        self._day = None
+        self._reset_buffer()
+
+    # ---------------- writing ----------------
+    def _reset_buffer(self):
+        self._keys = {}
+        self._rows = []  # (ts, underlying, key_idx, {field: int64[]})
+        self._last_stamp = None
+        self._flushed_ts = float("-inf")  # newest buffered row already written to the open chunk
+
+    def _day_dir(self, day):
+        return os.path.join(self.root, day)
+
+    def _index(self, day):
+        try:
+            with open(os.path.join(self._day_dir(day), "index.json")) as f:
+                return json.load(f)
+        except Exception:
+            return {"symbol": self.symbol, "chunks": []}
+
+    def append(self, oc, ts=None):
+        """Add one chain snapshot. Repeats of the same NSE timestamp are skipped; returns True if stored."""
+        cols = oc if isinstance(oc, dict) and "strike" in oc else chain_to_columns(oc)
+        if not len(cols["strike"]):
+            return False
+        ts = ts or time.time()
+        day = dt.datetime.fromtimestamp(ts).strftime("%Y-%m-%d")
+        with self._lock, span("archive.append", symbol=self.symbol) as sp:
+            if cols.get("timestamp") and cols["timestamp"] == self._last_stamp:
+                sp.set(cache_hit=True)
+                return False
+            if day != self._day:
+                self._flush_locked()
+                self._day = day
+                self._chunk_no = len(self._index(day)["chunks"])
+                self._reset_buffer()
+            keys = self._keys
+            idx = np.fromiter((keys.setdefault(k, len(keys)) for k in
+                               zip(cols["strike"].tolist(), cols["expiry"].tolist(), cols["side"].tolist())),
+                              dtype=np.int64, count=len(cols["strike"]))
+            vals = {f: _encode(cols[f], SCALE[f]) for f in FIELDS}
+            self._rows.append((ts, cols.get("underlying") or np.nan, idx, vals))
+            self._last_stamp = cols.get("timestamp")
+            sp.set(rows=len(idx))
+            if len(self._rows) >= self.chunk_size:
+                self._flush_locked()
+                self._chunk_no += 1
+                last = self._last_stamp
+                self._reset_buffer()
+                self._last_stamp = last
+        return True
+
+    def flush(self):
+        """Persist the open (partial) chunk; it keeps growing until chunk_size and is rewritten."""
+        with self._lock:
+            self._flush_locked()
+
+    def _flush_locked(self):
+        if not self._rows or self._day is None:
+            return
+        n, K = len(self._rows), len(self._keys)
+        key_list = list(self._keys)
+        arrays = {
+            "ts": np.array([r[0] for r in self._rows], dtype=np.float64),
+            "underlying": np.array([r[1] for r in self._rows], dtype=np.float64),
+            "key_strike": np.array([k[0] for k in key_list], dtype=np.float64),
+            "key_expiry": np.array([k[1] for k in key_list], dtype="U11"),
+            "key_side": np.array([k[2] for k in key_list], dtype=np.int8),
+        }
+        for f in FIELDS:
+            mat = np.full((n, K), MISSING, dtype=np.int64)
+            for i, (_, _, idx, vals) in enumerate(self._rows):
+                mat[i, idx] = vals[f]
+            arrays[f"d_{f}"] = _delta(mat)
+
+        ddir = self._day_dir(self._day)
+        os.makedirs(ddir, exist_ok=True)
+        name = f"chunk_{self._chunk_no:05d}.npz"
+        tmp = os.path.join(ddir, name + ".tmp")
+        with open(tmp, "wb") as fh:
+            np.savez_compressed(fh, **arrays)
+        os.replace(tmp, os.path.join(ddir, name))
+
+        index = self._index(self._day)
+        entry = {"file": name, "t0": arrays["ts"][0], "t1": arrays["ts"][-1], "n": n, "keys": K}
+        index["chunks"] = [c for c in index["chunks"] if c["file"] != name] + [entry]
+        index["chunks"].sort(key=lambda c: c["t0"])
+        with open(os.path.join(ddir, "index.json.tmp"), "w") as f:
+            json.dump(index, f)
+        os.replace(os.path.join(ddir, "index.json.tmp"), os.path.join(ddir, "index.json"))
+        self._cache.pop((self._day, name), None)
+        self._flushed_ts = arrays["ts"][-1]
+
+    # ---------------- reading ----------------
+    def days(self):
+        if not os.path.isdir(self.root):
+            return []
+        return sorted(d for d in os.listdir(self.root) if os.path.exists(os.path.join(self.root, d, "index.json")))
+
+    def timestamps(self, day):
+        out = [np.load(os.path.join(self._day_dir(day), c["file"]))["ts"] for c in self._index(day)["chunks"]]
+        return np.concatenate(out) if out else np.zeros(0)
+
+    def _chunk(self, day, name, members):
+        """Decode only `members` of one chunk; whole decoded chunks are kept in a small LRU."""
+        key = (day, name)
+        cached = self._cache.get(key)
+        if cached is not None and all(m in cached for m in members):
+            self._cache.move_to_end(key)
+            return cached
+        with np.load(os.path.join(self._day_dir(day), name)) as z:
+            loaded = dict(cached or {})
+            loaded.update({m: z[m] for m in members if m not in loaded})
+        self._cache[key] = loaded
+        while len(self._cache) > self._cache_chunks:
+            self._cache.popitem(last=False)
+        return loaded
+
+    def snapshot_at(self, ts, as_payload=False):
+        """Chain as of `ts` (latest snapshot at or before it) in columnar form, or NSE payload shape."""
+        day = dt.datetime.fromtimestamp(ts).strftime("%Y-%m-%d")
+        with span("archive.snapshot_at", symbol=self.symbol):
+            with self._lock:
+                buffered = self._buffered_at(day, ts)
+            cols = buffered if buffered is not None else self._stored_at(day, ts)
+        if cols is None:
+            return None
+        return columns_to_chain(cols) if as_payload else cols
+
+    def _buffered_at(self, day, ts):
+        if day != self._day or not self._rows or ts < self._rows[0][0]:
+            return None
+        i = bisect.bisect_right([r[0] for r in self._rows], ts) - 1
+        r_ts, und, idx, vals = self._rows[i]
+        keys = list(self._keys)
+        cols = {
+            "strike": np.array([keys[j][0] for j in idx], dtype=np.float64),
+            "expiry": np.array([keys[j][1] for j in idx], dtype="U11"),
+            "side": np.array([keys[j][2] for j in idx], dtype=np.int8),
+        }
+        cols.update({f: _decode(vals[f], SCALE[f]) for f in FIELDS})
+        cols.update({"underlying": None if np.isnan(und) else float(und), "timestamp": _stamp(r_ts)})
+        return cols
+
+    def _stored_at(self, day, ts):
+        chunks = self._index(day)["chunks"]
+        c = bisect.bisect_right([c["t0"] for c in chunks], ts) - 1
+        if c < 0:
+            return None
+        members = ["ts", "underlying", "key_strike", "key_expiry", "key_side"] + [f"d_{f}" for f in FIELDS]
+        z = self._chunk(day, chunks[c]["file"], members)
+        i = bisect.bisect_right(z["ts"].tolist(), ts) - 1
+        mats = {f: z[f"d_{f}"][:i + 1].sum(axis=0) for f in FIELDS}
+        present = np.zeros(len(z["key_strike"]), dtype=bool)
+        for m in mats.values():
+            present |= m != MISSING
+        cols = {"strike": z["key_strike"][present], "expiry": z["key_expiry"][present], "side": z["key_side"][present]}
+        cols.update({f: _decode(m[present], SCALE[f]) for f, m in mats.items()})
+        und = z["underlying"][i]
+        cols.update({"underlying": None if np.isnan(und) else float(und), "timestamp": _stamp(z["ts"][i])})
+        return cols
+
+    def strike_series(self, strike, side="CE", field="oi", expiry=None, start=None, end=None):
+        """
+        (timestamps, values) of one field for one strike/side, decoding only that field's
+        chunks in [start, end]. expiry=None follows the nearest listed expiry of each chunk.
+        """
+        side_i = 0 if str(side).upper() == "CE" else 1
+        start = start or 0.0
+        end = end or float("inf")
+        ts_out, val_out = [], []
+        with span("archive.strike_series", symbol=self.symbol, field=field):
+            for day in self.days():
+                day_t0 = dt.datetime.strptime(day, "%Y-%m-%d").timestamp()
+                if day_t0 > end or day_t0 + 86400 <= start:
+                    continue
+                for c in self._index(day)["chunks"]:
+                    if c["t1"] < start or c["t0"] > end:
+                        continue
+                    z = self._chunk(day, c["file"], ["ts", "key_strike", "key_expiry", "key_side", f"d_{field}"])
+                    match = (z["key_strike"] == float(strike)) & (z["key_side"] == side_i)
+                    if expiry is not None:
+                        match &= z["key_expiry"] == expiry
+                    cand = np.flatnonzero(match)
+                    if not len(cand):
+                        continue
+                    if len(cand) > 1:
+                        cand = cand[np.argsort([expiry_date(e).toordinal() for e in z["key_expiry"][cand]])]
+                    col = np.cumsum(z[f"d_{field}"][:, cand[0]])
+                    keep = (z["ts"] >= start) & (z["ts"] <= end)
+                    ts_out.append(z["ts"][keep])
+                    val_out.append(_decode(col[keep], SCALE[field]))
+            with self._lock:
+                # rows up to the last flush are already in the open chunk read above
+                buffered = [(r[0], r[2], r[3][field]) for r in self._rows
+                            if start <= r[0] <= end and r[0] > self._flushed_ts]
+                keys = list(self._keys)
+            for r_ts, idx, vals in buffered:
+                hits = [j for j, k in enumerate(idx.tolist()) if keys[k][0] == float(strike) and keys[k][2] == side_i
+                        and (expiry is None or keys[k][1] == expiry)]
+                if hits:
+                    j = min(hits, key=lambda j: expiry_date(keys[idx[j]][1]))
+                    ts_out.append(np.array([r_ts]))
+                    val_out.append(_decode(vals[j:j + 1], SCALE[field]))
+        if not ts_out:
+            return np.zeros(0), np.zeros(0)
+        return np.concatenate(ts_out), np.concatenate(val_out)
+
+    def disk_bytes(self):
+        total = 0
+        for day in self.days():
+            ddir = self._day_dir(day)
+            total += sum(os.path.getsize(os.path.join(ddir, f)) for f in os.listdir(ddir))
+        return total
+
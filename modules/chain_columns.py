@@ -0,0 +1,98 @@
+import hashlib, datetime as dt
+import numpy as np
+
+# -------------------------------------------------------------
+# Columnar option chain
+# -------------------------------------------------------------
+# One row per (expiry, strike, side). Numeric fields are float64 with NaN where
+# NSE left the leg out:
+#   {"strike": f8[n], "expiry": U11[n], "side": i1[n] (0=CE, 1=PE),
+#    "oi": f8[n], "chg_oi": ..., "iv": ..., "ltp": ..., "bid": ..., "ask": ..., "volume": ...,
+#    "underlying": float, "timestamp": str}
+
+SIDES = ("CE", "PE")
+FIELDS = ("oi", "chg_oi", "iv", "ltp", "bid", "ask", "volume")
+NSE_KEYS = {
+    "oi": "openInterest",
+    "chg_oi": "changeinOpenInterest",
+    "iv": "impliedVolatility",
+    "ltp": "lastPrice",
+    "bid": "bidprice",
+    "ask": "askPrice",
+    "volume": "totalTradedVolume",
+}
+
+
+def empty_columns():
+    cols = {"strike": np.zeros(0), "expiry": np.zeros(0, dtype="U11"), "side": np.zeros(0, dtype=np.int8)}
+    cols.update({f: np.zeros(0) for f in FIELDS})
+    cols.update({"underlying": None, "timestamp": None})
+    return cols
+
+
+def chain_to_columns(oc):
+    """Flatten an NSE-shaped chain payload into column arrays."""
+    recs = (oc or {}).get("records", {}) or {}
+    strike, expiry, side = [], [], []
+    vals = {f: [] for f in FIELDS}
+    for row in recs.get("data", []) or []:
+        for s, leg_key in enumerate(SIDES):
+            leg = row.get(leg_key)
+            if not leg:
+                continue
+            strike.append(row.get("strikePrice", leg.get("strikePrice")))
+            expiry.append(row.get("expiryDate", leg.get("expiryDate")) or "")
+            side.append(s)
+            for f, k in NSE_KEYS.items():
+                v = leg.get(k)
+                vals[f].append(np.nan if v is None else v)
+    cols = {
+        "strike": np.asarray(strike, dtype=np.float64),
+        "expiry": np.asarray(expiry, dtype="U11"),
+        "side": np.asarray(side, dtype=np.int8),
+    }
+    cols.update({f: np.asarray(v, dtype=np.float64) for f, v in vals.items()})
+    cols["underlying"] = recs.get("underlyingValue")
+    cols["timestamp"] = recs.get("timestamp")
+    return cols
+
+
+def columns_to_chain(cols):
+    """Inverse of chain_to_columns: rebuild the NSE payload shape parse_chain() reads."""
+    rows = {}
+    n = len(cols["strike"])
+    for i in range(n):
+        k = float(cols["strike"][i])
+        k = int(k) if k.is_integer() else k
+        e = str(cols["expiry"][i])
+        row = rows.setdefault((e, k), {"strikePrice": k, "expiryDate": e})
+        leg = {"strikePrice": k, "expiryDate": e}
+        for f, key in NSE_KEYS.items():
+            v = cols[f][i]
+            if not np.isnan(v):
+                leg[key] = int(v) if f in ("oi", "chg_oi", "volume") else float(v)
+        row[SIDES[int(cols["side"][i])]] = leg
+    recs = {"data": list(rows.values())}
+    if cols.get("underlying") is not None:
+        recs["underlyingValue"] = cols["underlying"]
+    if cols.get("timestamp"):
+        recs["timestamp"] = cols["timestamp"]
+    recs["expiryDates"] = sorted({e for e, _ in rows}, key=expiry_date)
+    return {"records": recs}
+
+
+def columns_digest(cols):
+    """Content hash of a chain_columns dict (arrays, underlying and timestamp) for memo keys."""
+    h = hashlib.blake2b(digest_size=16)
+    for c in ("strike", "expiry", "side") + FIELDS:
+        h.update(np.ascontiguousarray(cols[c]).tobytes())
+    h.update(repr((cols.get("underlying"), cols.get("timestamp"))).encode())
+    return h.hexdigest()
+
+
+def expiry_date(e):
+    """NSE expiry string ("28-Nov-2024") as a date; unparseable values sort last."""
+    try:
+        return dt.datetime.strptime(str(e), "%d-%b-%Y").date()
+    except ValueError:
+        return dt.date.max
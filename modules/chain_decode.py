@@ -0,0 +1,211 @@
+import json
+from typing import List, Optional
+import numpy as np
+
+from .chain_columns import FIELDS, chain_to_columns
+
+try:
+    import msgspec
+except ImportError:  # optional: falls back to a full decode + chain_to_columns
+    msgspec = None
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# -------------------------------------------------------------
+# Field-selective decoding of NSE payloads
+# -------------------------------------------------------------
+# NSE option-chain responses carry ~25 fields per leg; parse_chain and the
+# smile fit read eight. With msgspec the bytes are decoded against typed
+# structs: only the declared fields are materialised (everything else is
+# skipped by the parser, no dicts or strings allocated) and the legs go
+# straight into chain_columns arrays. Without msgspec, orjson (or json) does a
+# full decode followed by chain_to_columns.
+
+BACKEND = "msgspec" if msgspec else "orjson" if orjson else "json"
+
+
+def loads(raw):
+    """Full decode for payloads that are kept as dicts (indices, recordings)."""
+    return orjson.loads(raw) if orjson else json.loads(raw)
+
+
+if msgspec:
+    class _Leg(msgspec.Struct, gc=False):
+        strikePrice: Optional[float] = None
+        expiryDate: Optional[str] = None
+        openInterest: Optional[float] = None
+        changeinOpenInterest: Optional[float] = None
+        impliedVolatility: Optional[float] = None
+        lastPrice: Optional[float] = None
+        bidprice: Optional[float] = None
+        askPrice: Optional[float] = None
+        totalTradedVolume: Optional[float] = None
+
+    class _Row(msgspec.Struct, gc=False):
+        strikePrice: Optional[float] = None
+        expiryDate: Optional[str] = None
+        CE: Optional[_Leg] = None
+        PE: Optional[_Leg] = None
+
+    class _Records(msgspec.Struct, gc=False):
+        data: List[_Row] = []
+        underlyingValue: Optional[float] = None
+        timestamp: Optional[str] = None
+
+    class _Chain(msgspec.Struct, gc=False):
+        records: Optional[_Records] = None
+
+    class _SpotRecords(msgspec.Struct, gc=False):
+        underlyingValue: Optional[float] = None
+
+    class _IndexSpot(msgspec.Struct, gc=False):
+        records: Optional[_SpotRecords] = None
+
+    class _PriceInfo(msgspec.Struct, gc=False):
+        lastPrice: Optional[float] = None
+
+    class _Quote(msgspec.Struct, gc=False):
+        priceInfo: Optional[_PriceInfo] = None
+
+    _EMPTY_LEG = _Leg()
+    _CHAIN = msgspec.json.Decoder(_Chain)
+    _INDEX_SPOT = msgspec.json.Decoder(_IndexSpot)
+    _QUOTE = msgspec.json.Decoder(_Quote)
+
+
+def _legs_to_columns(recs):
+    rows, expiry = [], []
+    for row in recs.data:
+        for s, leg in ((0, row.CE), (1, row.PE)):
+            if leg is None or leg == _EMPTY_LEG:
+                continue
+            rows.append((row.strikePrice if row.strikePrice is not None else leg.strikePrice, s,
+                         leg.openInterest, leg.changeinOpenInterest, leg.impliedVolatility,
+                         leg.lastPrice, leg.bidprice, leg.askPrice, leg.totalTradedVolume))
+            expiry.append(row.expiryDate or leg.expiryDate or "")
+    # None -> NaN in the float conversion
+    mat = np.array(rows, dtype=np.float64).reshape(len(rows), 2 + len(FIELDS))
+    cols = {"strike": mat[:, 0].copy(), "expiry": np.asarray(expiry, dtype="U11"), "side": mat[:, 1].astype(np.int8)}
+    cols.update({f: mat[:, 2 + i].copy() for i, f in enumerate(FIELDS)})
+    cols["underlying"] = recs.underlyingValue
+    cols["timestamp"] = recs.timestamp
+    return cols
+
+
+def decode_chain(raw):
+    """NSE option-chain bytes -> chain_columns dict."""
+    if msgspec:
+        try:
+            chain = _CHAIN.decode(raw)
+        except msgspec.ValidationError as e:
+            # an unexpected type in one field (e.g. "-" for a number): take the tolerant path
+            print(f"[WARN] decode_chain: {e}; using full decode")
+            return chain_to_columns(loads(raw))
+        if chain.records is None:
+            return chain_to_columns(None)
+        return _legs_to_columns(chain.records)
+    return chain_to_columns(loads(raw))
+
+
+def decode_index_spot(raw):
+    """records.underlyingValue from an index option-chain response, without decoding the chain."""
+    if msgspec:
+        recs = _INDEX_SPOT.decode(raw).records
+        return recs.underlyingValue if recs else None
+    return (loads(raw).get("records") or {}).get("underlyingValue")
+
+
+def decode_quote_price(raw):
+    """priceInfo.lastPrice from a quote-equity response."""
+    if msgspec:
+        info = _QUOTE.decode(raw).priceInfo
+        return info.lastPrice if info else None
+    return (loads(raw).get("priceInfo") or {}).get("lastPrice")
+
+
+# -------------------------------------------------------------
+# Benchmark: full decode + parse_chain vs field-selective decode
+#   python -m modules.chain_decode [data/recordings] --repeat 20
+# -------------------------------------------------------------
+def _synthetic_payload(strikes=180, expiries=14, spot=2900.0, seed=0):
+    """NSE-shaped stock chain with the full per-leg field set (a several-MB payload)."""
+    rng = np.random.default_rng(seed)
+    dates = [f"{d:02d}-{m}-2026" for m in ("Nov", "Dec", "Jan", "Feb") for d in (5, 12, 19, 26)][:expiries]
+    data = []
+    for e in dates:
+        for i in range(strikes):
+            k = round(spot * 0.5 + i * spot / strikes, 1)
+            row = {"strikePrice": k, "expiryDate": e}
+            for side in ("CE", "PE"):
+                row[side] = {
+                    "strikePrice": k, "expiryDate": e, "underlying": "RELIANCE",
+                    "identifier": f"OPTSTKRELIANCE{e}{side}{k:.2f}",
+                    "openInterest": int(rng.integers(0, 5000)), "changeinOpenInterest": int(rng.integers(-300, 300)),
+                    "pchangeinOpenInterest": float(rng.normal()), "totalTradedVolume": int(rng.integers(0, 10 ** 5)),
+                    "impliedVolatility": round(float(rng.uniform(15, 45)), 2), "lastPrice": round(float(rng.uniform(0, 300)), 2),
+                    "change": float(rng.normal()), "pChange": float(rng.normal()),
+                    "totalBuyQuantity": int(rng.integers(0, 10 ** 5)), "totalSellQuantity": int(rng.integers(0, 10 ** 5)),
+                    "bidQty": int(rng.integers(0, 5000)), "bidprice": round(float(rng.uniform(0, 300)), 2),
+                    "askQty": int(rng.integers(0, 5000)), "askPrice": round(float(rng.uniform(0, 300)), 2),
+                    "underlyingValue": spot,
+                }
+            data.append(row)
+    return {"records": {"expiryDates": dates, "data": data, "timestamp": "06-Nov-2026 15:30:00",
+                        "underlyingValue": spot, "strikePrices": sorted({r["strikePrice"] for r in data})},
+            "filtered": {"data": data[:strikes], "CE": {}, "PE": {}}}
+
+
+def _measure(fn, raw, repeat):
+    import time, tracemalloc
+    fn(raw)  # warm-up
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        fn(raw)
+    el = (time.perf_counter() - t0) / repeat
+    tracemalloc.start()
+    fn(raw)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return el, peak
+
+
+def _main(argv=None):
+    import argparse
+    from .analytics import parse_chain
+    from .market_data import load_snapshots
+
+    ap = argparse.ArgumentParser(prog="python -m modules.chain_decode")
+    ap.add_argument("path", nargs="?", help="recording file/dir (default: synthetic stock chain)")
+    ap.add_argument("--repeat", type=int, default=20)
+    args = ap.parse_args(argv)
+
+    if args.path:
+        payloads = [s["payload"] for s in load_snapshots(args.path) if s["kind"] == "option_chain"]
+        if not payloads:
+            ap.error(f"no option_chain snapshots in {args.path}")
+        raw = max((json.dumps(p).encode() for p in payloads), key=len)
+    else:
+        raw = json.dumps(_synthetic_payload()).encode()
+
+    # per refresh compute_core_metrics needs parse_chain output plus the columns fit_surface reads
+    def full(decode):
+        def run(b):
+            oc = decode(b)
+            return parse_chain(oc), chain_to_columns(oc)
+        return run
+    cases = [("json.loads (r.json) + parse + columns", full(json.loads))]
+    if orjson:
+        cases.append(("orjson.loads + parse + columns", full(orjson.loads)))
+    cases.append((f"decode_chain [{BACKEND}] + parse", lambda b: parse_chain(decode_chain(b))))
+    print(f"[decode] payload {len(raw) / 1e6:.2f} MB, {args.repeat} runs each")
+    base = None
+    for name, fn in cases:
+        el, peak = _measure(fn, raw, args.repeat)
+        base = base or (el, peak)
+        print(f"  {name:<38} {el * 1e3:8.2f} ms  x{base[0] / el:5.2f}   peak {peak / 1e6:7.2f} MB  x{base[1] / peak:5.2f}")
+
+
+if __name__ == "__main__":
+    _main()
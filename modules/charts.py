@@ -2,9 +2,11 @@ import matplotlib.pyplot as plt
 import numpy as np
 import matplotlib.ticker as mtick
 import datetime as dt
+from .perf_trace import traced
 
 plt.style.use("seaborn-v0_8-whitegrid")
 
+@traced()
 def plot_iv_rank_history(iv_data=None):
     """
     Simple IV history line chart similar to Groww style.
@@ -31,6 +33,7 @@ def plot_iv_rank_history(iv_data=None):
     return fig
 
 
+@traced()
 def plot_expected_move_chart(spot, metrics):
     """
     Expected Move Band Chart – Groww-style visualization
@@ -40,10 +43,13 @@ def plot_expected_move_chart(spot, metrics):
     if not spot:
         spot = 0
 
-    # Simulate 3-day projection
+    # Simulate 3-day projection (skew-aware band edges when a smile was fitted)
     days = np.arange(0, 4)
-    upper = spot + np.linspace(0, exp3d, len(days))
-    lower = spot - np.linspace(0, exp3d, len(days))
+    band_lo, band_hi = metrics.get("skew_band_3d") or (None, None)
+    up3d = (band_hi - spot) if band_hi else exp3d
+    dn3d = (spot - band_lo) if band_lo else exp3d
+    upper = spot + np.linspace(0, up3d, len(days))
+    lower = spot - np.linspace(0, dn3d, len(days))
 
     fig, ax = plt.subplots(figsize=(8, 3))
     ax.plot(days, [spot]*len(days), color="#222222", linestyle="--", linewidth=1.2, label="Spot")
@@ -1,4 +1,7 @@
-import requests, json, time, re, os
+import requests, time, re, threading
+from .perf_trace import span, payload_bytes
+from .resilience import FetchError, CircuitOpenError, breaker
+from .chain_decode import loads, decode_chain, decode_index_spot, decode_quote_price
 
 HEADERS = {
     "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 "
@@ -7,81 +10,138 @@ HEADERS = {
 }
 
 NSE_BASE = "https://www.nseindia.com"
+TIMEOUT = (3.05, 6)      # connect, read
+SESSION_TTL = 300        # seconds before the homepage cookies are refreshed
 
-def _session():
-    s = requests.Session()
-    s.headers.update(HEADERS)
-    s.get("https://www.nseindia.com", timeout=10)
-    return s
+_SESSION = None
+_SESSION_AT = 0.0
+_SESSION_LOCK = threading.Lock()
+
+def _session(refresh=False):
+    """Shared NSE session; the homepage cookie warm-up runs once per SESSION_TTL (or on 401/403)."""
+    global _SESSION, _SESSION_AT
+    with _SESSION_LOCK:
+        if _SESSION is not None and not refresh and time.time() - _SESSION_AT < SESSION_TTL:
+            return _SESSION
+        s = requests.Session()
+        s.headers.update(HEADERS)
+        with span("nse.warmup") as sp:
+            r = s.get("https://www.nseindia.com", timeout=TIMEOUT)
+            sp.set(bytes=payload_bytes(r))
+        _SESSION, _SESSION_AT = s, time.time()
+        return s
+
+def _get_json(path, endpoint, symbol=None, decode=loads):
+    """GET an NSE API path behind the endpoint's circuit breaker and decode the body bytes; raises FetchError."""
+    cb = breaker(endpoint)
+    if not cb.allow():
+        raise CircuitOpenError(f"{endpoint}: circuit open")
+    try:
+        with span(endpoint, symbol=symbol) as sp:
+            r = _session().get(f"{NSE_BASE}{path}", timeout=TIMEOUT)
+            if r.status_code in (401, 403):
+                r = _session(refresh=True).get(f"{NSE_BASE}{path}", timeout=TIMEOUT)
+            r.raise_for_status()
+            data = decode(r.content)
+            sp.set(bytes=payload_bytes(r))
+    except Exception as e:
+        cb.record_failure()
+        raise FetchError(f"{endpoint}: {e}") from e
+    cb.record_success()
+    return data
 
 # -------------------------------------------------------------
 # Index and VIX
 # -------------------------------------------------------------
+def load_indices_nse():
+    data = _get_json("/api/allIndices", "nse.indices")
+    mapping = {}
+    for i in data.get("data", []):
+        name = i.get("index", "").upper().replace(" ", "")
+        mapping[name] = float(i.get("last", 0))
+    if not mapping:
+        raise FetchError("nse.indices: empty payload")
+    if "NIFTY50" in mapping:
+        mapping["NIFTY"] = mapping["NIFTY50"]
+    if "NIFTYBANK" in mapping:
+        mapping["BANKNIFTY"] = mapping["NIFTYBANK"]
+    if "INDIAVIX" not in mapping:
+        mapping["INDIAVIX"] = 14.0
+    return mapping
+
 def fetch_indices_nse():
     try:
-        s = _session()
-        r = s.get(f"{NSE_BASE}/api/allIndices", timeout=10)
-        data = r.json()
-        mapping = {}
-        for i in data.get("data", []):
-            name = i.get("index", "").upper().replace(" ", "")
-            mapping[name] = float(i.get("last", 0))
-        if "NIFTY50" in mapping:
-            mapping["NIFTY"] = mapping["NIFTY50"]
-        if "NIFTYBANK" in mapping:
-            mapping["BANKNIFTY"] = mapping["NIFTYBANK"]
-        if "INDIAVIX" not in mapping:
-            mapping["INDIAVIX"] = 14.0
-        return mapping
-    except Exception as e:
+        return load_indices_nse()
+    except FetchError as e:
         print(f"[WARN] fetch_indices_nse failed: {e}")
         return {"INDIAVIX": 14.0}
 
 # -------------------------------------------------------------
 # Spot Price (Stock or Index)
 # -------------------------------------------------------------
-def fetch_spot_price(symbol: str):
+def _tradingview_spot(symbol):
+    cb = breaker("tradingview.spot")
+    if not cb.allow():
+        raise CircuitOpenError("tradingview.spot: circuit open")
+    try:
+        with span("tradingview.spot", symbol=symbol.upper()) as sp:
+            r = requests.get(f"https://in.tradingview.com/symbols/NSE-{symbol}/", timeout=TIMEOUT)
+            sp.set(bytes=payload_bytes(r))
+        m = re.search(r'"regularMarketPrice":([0-9]+\.[0-9]+)', r.text)
+        if not m:
+            raise FetchError("price not found in page")
+    except Exception as e:
+        cb.record_failure()
+        raise FetchError(f"tradingview.spot: {e}") from e
+    cb.record_success()
+    return float(m.group(1))
+
+def load_spot_price(symbol: str):
     try:
-        s = _session()
         # For indices
         if symbol.upper() in ["NIFTY", "BANKNIFTY"]:
-            r = s.get(f"{NSE_BASE}/api/option-chain-indices?symbol={symbol.upper()}", timeout=10)
-            data = r.json()
-            return float(data["records"]["underlyingValue"])
+            return float(_get_json(f"/api/option-chain-indices?symbol={symbol.upper()}", "nse.spot", symbol.upper(),
+                                   decode=decode_index_spot))
         # For equities
-        r = s.get(f"{NSE_BASE}/api/quote-equity?symbol={symbol.upper()}", timeout=10)
-        data = r.json()
-        return float(data["priceInfo"]["lastPrice"])
-    except Exception as e:
+        return float(_get_json(f"/api/quote-equity?symbol={symbol.upper()}", "nse.spot", symbol.upper(),
+                               decode=decode_quote_price))
+    except (FetchError, KeyError, TypeError, ValueError) as e:
+        print(f"[WARN] NSE spot failed for {symbol}: {e}")
+    # TradingView fallback
+    return _tradingview_spot(symbol)
+
+def fetch_spot_price(symbol: str):
+    try:
+        return load_spot_price(symbol)
+    except FetchError as e:
         print(f"[WARN] fetch_spot_price failed for {symbol}: {e}")
-        # TradingView fallback
-        try:
-            r = requests.get(f"https://in.tradingview.com/symbols/NSE-{symbol}/", timeout=10)
-            m = re.search(r'"regularMarketPrice":([0-9]+\.[0-9]+)', r.text)
-            if m:
-                return float(m.group(1))
-        except Exception as ee:
-            print(f"[WARN] TradingView fallback failed: {ee}")
     return None
 
 # -------------------------------------------------------------
-# Option Chain (with local fallback)
+# Option Chain
 # -------------------------------------------------------------
+def _chain_path(symbol):
+    if symbol.upper() in ["NIFTY", "BANKNIFTY"]:
+        return f"/api/option-chain-indices?symbol={symbol.upper()}"
+    return f"/api/option-chain-equities?symbol={symbol.upper()}"
+
+def load_option_chain(symbol: str):
+    data = _get_json(_chain_path(symbol), "nse.option_chain", symbol.upper())
+    if not (data.get("records") or {}).get("data"):
+        raise FetchError(f"nse.option_chain: empty chain for {symbol}")
+    return data
+
+def load_option_chain_columns(symbol: str):
+    """Chain as chain_columns arrays, decoded field-selectively from the response bytes (see chain_decode)."""
+    cols = _get_json(_chain_path(symbol), "nse.option_chain", symbol.upper(), decode=decode_chain)
+    if not len(cols["strike"]):
+        raise FetchError(f"nse.option_chain: empty chain for {symbol}")
+    return cols
+
 def fetch_option_chain(symbol: str):
-    s = _session()
+    """Non-raising wrapper: an empty chain on failure (record a session and use the replay provider for offline work)."""
     try:
-        url = f"{NSE_BASE}/api/option-chain-indices?symbol={symbol.upper()}"
-        if symbol.upper() not in ["NIFTY", "BANKNIFTY"]:
-            url = f"{NSE_BASE}/api/option-chain-equities?symbol={symbol.upper()}"
-        r = s.get(url, timeout=10)
-        data = r.json()
-        if "records" in data and "data" in data["records"]:
-            return data
-    except Exception as e:
+        return load_option_chain(symbol)
+    except FetchError as e:
         print(f"[WARN] NSE OC fetch failed for {symbol}: {e}")
-
-    # Fallback to local sample if NSE fails
-    sample_path = os.path.join(os.path.dirname(__file__), "sample_oc.json")
-    if os.path.exists(sample_path):
-        return json.load(open(sample_path))
     return {"records": {"data": []}}
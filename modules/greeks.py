@@ -24,3 +24,31 @@ def greeks(S, K, r, q, sigma, T, call=True):
     vega = S * math.exp(-q*T) * _norm_pdf(d1) * math.sqrt(T)
     theta = -(S*math.exp(-q*T)*_norm_pdf(d1)*sigma)/(2*math.sqrt(T))
     return delta, theta, vega
+
+def bs_price(S, K, r, q, sigma, T, call=True):
+    d1, d2 = d1_d2(S,K,r,q,sigma,T)
+    if any(map(lambda x: math.isnan(x), [d1,d2])):
+        return None
+    if call:
+        return S*math.exp(-q*T)*_norm_cdf(d1) - K*math.exp(-r*T)*_norm_cdf(d2)
+    return K*math.exp(-r*T)*_norm_cdf(-d2) - S*math.exp(-q*T)*_norm_cdf(-d1)
+
+def implied_vol(price, S, K, r, q, T, call=True, guess=0.2, tol=1e-6, max_iter=50):
+    """Newton on vega with a bisection fallback; returns annualised sigma or None."""
+    if not price or price <= 0 or S <= 0 or K <= 0 or T <= 0:
+        return None
+    lo, hi = 1e-4, 5.0
+    sigma = min(max(guess or 0.2, lo), hi)
+    for _ in range(max_iter):
+        p = bs_price(S, K, r, q, sigma, T, call)
+        if p is None:
+            return None
+        diff = p - price
+        if abs(diff) <= tol*max(price, 1e-4):
+            return sigma
+        if diff > 0: hi = sigma
+        else: lo = sigma
+        _, _, vega = greeks(S, K, r, q, sigma, T, call)
+        step = diff/vega if vega and vega > 1e-8 else None
+        sigma = sigma - step if step is not None and lo < sigma - step < hi else 0.5*(lo+hi)
+    return sigma if hi - lo < 1e-3 else None
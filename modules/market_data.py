@@ -0,0 +1,398 @@
+import os, json, gzip, zlib, time, glob, bisect, threading, datetime as dt
+
+from .data_fetcher import load_indices_nse, load_spot_price, load_option_chain, load_option_chain_columns
+from .chain_columns import chain_to_columns
+from .greeks import implied_vol
+from .vol_surface import cached_surface
+from .perf_trace import span
+from .resilience import FetchError
+
+INDEX_SYMBOLS = ["NIFTY", "BANKNIFTY"]
+EMPTY_CHAIN = {"records": {"data": []}}
+
+# -------------------------------------------------------------
+# Provider interface
+# -------------------------------------------------------------
+class MarketDataProvider:
+    """
+    Source of indices, spot prices and option chains.
+    Payloads keep the NSE shapes so analytics/strategy code is provider-agnostic:
+      indices()            -> {"NIFTY": 22000.0, "BANKNIFTY": ..., "INDIAVIX": 14.2, ...}
+      spot(symbol)         -> float or None
+      option_chain(symbol) -> {"records": {"data": [...], "underlyingValue": ...}}
+      option_chain_columns(symbol) -> the same chain as chain_columns arrays
+    Live providers raise FetchError on failure; retries, circuit breaking and stale
+    fallback are layered on top by resilience.ResilientFetcher.
+    """
+    name = "base"
+
+    def indices(self):
+        raise NotImplementedError
+
+    def spot(self, symbol):
+        raise NotImplementedError
+
+    def option_chain(self, symbol):
+        raise NotImplementedError
+
+    def option_chain_columns(self, symbol):
+        return chain_to_columns(self.option_chain(symbol))
+
+
+class NSEProvider(MarketDataProvider):
+    """Live NSE endpoints with the TradingView spot fallback (modules.data_fetcher)."""
+    name = "nse"
+
+    def indices(self):
+        return load_indices_nse()
+
+    def spot(self, symbol):
+        return load_spot_price(symbol)
+
+    def option_chain(self, symbol):
+        return load_option_chain(symbol)
+
+    def option_chain_columns(self, symbol):
+        return load_option_chain_columns(symbol)
+
+
+# -------------------------------------------------------------
+# Kite quotes
+# -------------------------------------------------------------
+class KiteQuoteProvider(MarketDataProvider):
+    """
+    Zerodha Kite quote API. The chain is assembled from NFO instruments of the
+    nearest expiries; Kite has no IV field, so IVs are solved from LTP.
+    """
+    name = "kite"
+    QUOTE_KEYS = {"NIFTY": "NSE:NIFTY 50", "BANKNIFTY": "NSE:NIFTY BANK", "INDIAVIX": "NSE:INDIA VIX"}
+    BATCH = 500  # Kite caps instruments per quote() call
+
+    def __init__(self, api_key, access_token, expiries=2, r=0.07, kite=None):
+        if kite is None:
+            from kiteconnect import KiteConnect
+            kite = KiteConnect(api_key=api_key)
+            kite.set_access_token(access_token)
+        self.kite = kite
+        self.expiries = expiries
+        self.r = r
+        self._instruments = None
+        self._instruments_day = None
+
+    def _quote(self, keys):
+        out = {}
+        for i in range(0, len(keys), self.BATCH):
+            with span("kite.quote") as sp:
+                out.update(self.kite.quote(keys[i:i + self.BATCH]) or {})
+                sp.set(rows=len(keys[i:i + self.BATCH]))
+        return out
+
+    def indices(self):
+        try:
+            q = self._quote(list(self.QUOTE_KEYS.values()))
+            mapping = {k: float(q[v]["last_price"]) for k, v in self.QUOTE_KEYS.items() if v in q}
+        except Exception as e:
+            raise FetchError(f"kite.indices: {e}") from e
+        if not mapping:
+            raise FetchError("kite.indices: empty quote")
+        mapping.setdefault("INDIAVIX", 14.0)
+        return mapping
+
+    def spot(self, symbol):
+        key = self.QUOTE_KEYS.get(symbol.upper(), f"NSE:{symbol.upper()}")
+        try:
+            return float(self._quote([key])[key]["last_price"])
+        except Exception as e:
+            raise FetchError(f"kite.spot {symbol}: {e}") from e
+
+    def _nfo_instruments(self):
+        today = dt.date.today()
+        if self._instruments is None or self._instruments_day != today:
+            with span("kite.instruments") as sp:
+                self._instruments = self.kite.instruments("NFO")
+                sp.set(rows=len(self._instruments))
+            self._instruments_day = today
+        return self._instruments
+
+    def option_chain(self, symbol):
+        sym = symbol.upper()
+        try:
+            today = dt.date.today()
+            opts = [i for i in self._nfo_instruments()
+                    if i.get("name") == sym and i.get("instrument_type") in ("CE", "PE") and i.get("expiry") and i["expiry"] >= today]
+            expiries = sorted({i["expiry"] for i in opts})[:self.expiries]
+            opts = [i for i in opts if i["expiry"] in expiries]
+            spot = self.spot(sym)
+            quotes = self._quote([f"NFO:{i['tradingsymbol']}" for i in opts])
+        except Exception as e:
+            raise FetchError(f"kite.option_chain {symbol}: {e}") from e
+        # warm-start IV solves from the last fitted smile (compute_core_metrics refits it each refresh)
+        surface = cached_surface(sym, spot, r=self.r)
+
+        rows = {}
+        for i in opts:
+            q = quotes.get(f"NFO:{i['tradingsymbol']}")
+            if not q:
+                continue
+            expiry = i["expiry"].strftime("%d-%b-%Y")
+            T = max((i["expiry"] - today).days, 0.5) / 365.0
+            ltp = q.get("last_price") or 0.0
+            call = i["instrument_type"] == "CE"
+            if not spot:
+                iv = None
+            elif surface:
+                iv = surface.implied_vol(ltp, i["strike"], T, call=call, S=spot)
+            else:
+                iv = implied_vol(ltp, spot, i["strike"], self.r, 0.0, T, call=call)
+            depth = q.get("depth") or {}
+            bid = (depth.get("buy") or [{}])[0]
+            ask = (depth.get("sell") or [{}])[0]
+            row = rows.setdefault((i["strike"], expiry), {"strikePrice": i["strike"], "expiryDate": expiry})
+            row[i["instrument_type"]] = {
+                "strikePrice": i["strike"],
+                "expiryDate": expiry,
+                "underlying": sym,
+                "identifier": i["tradingsymbol"],
+                "openInterest": q.get("oi") or 0,
+                "totalTradedVolume": q.get("volume") or 0,
+                "impliedVolatility": round(iv * 100, 2) if iv else 0,
+                "lastPrice": ltp,
+                "change": q.get("net_change") or 0,
+                "bidQty": bid.get("quantity") or 0,
+                "bidprice": bid.get("price") or 0,
+                "askQty": ask.get("quantity") or 0,
+                "askPrice": ask.get("price") or 0,
+                "underlyingValue": spot,
+            }
+        return {"records": {
+            "expiryDates": [e.strftime("%d-%b-%Y") for e in expiries],
+            "data": sorted(rows.values(), key=lambda r: (r["expiryDate"], r["strikePrice"])),
+            "timestamp": dt.datetime.now().strftime("%d-%b-%Y %H:%M:%S"),
+            "underlyingValue": spot,
+        }}
+
+
+# -------------------------------------------------------------
+# Record & replay
+# -------------------------------------------------------------
+# Snapshot files are gzip'd JSON lines, one response per line:
+#   {"ts": 1731043200.12, "kind": "option_chain", "symbol": "NIFTY", "payload": {...}}
+# Each recording session writes data/recordings/<provider>_<YYYYmmdd_HHMMSS>.jsonl.gz.
+# Every record is appended as its own gzip member, so a file is readable while
+# it is still being written and after the recorder is killed without close().
+
+class RecordingProvider(MarketDataProvider):
+    """Pass-through wrapper that appends every response of `inner` to a snapshot file."""
+
+    def __init__(self, inner, out_dir=os.path.join("data", "recordings")):
+        self.inner = inner
+        self.name = f"{inner.name}+record"
+        os.makedirs(out_dir, exist_ok=True)
+        stamp = dt.datetime.now().strftime("%Y%m%d_%H%M%S")
+        self.path = os.path.join(out_dir, f"{inner.name}_{stamp}.jsonl.gz")
+        self._lock = threading.Lock()
+
+    def _record(self, kind, symbol, payload):
+        line = json.dumps({"ts": round(time.time(), 3), "kind": kind, "symbol": symbol, "payload": payload})
+        member = gzip.compress((line + "\n").encode("utf-8"))
+        with self._lock, open(self.path, "ab") as fh:
+            fh.write(member)
+        return payload
+
+    def indices(self):
+        return self._record("indices", None, self.inner.indices())
+
+    def spot(self, symbol):
+        return self._record("spot", symbol.upper(), self.inner.spot(symbol))
+
+    def option_chain(self, symbol):
+        return self._record("option_chain", symbol.upper(), self.inner.option_chain(symbol))
+
+    def close(self):
+        pass  # nothing held open between records
+
+
+def load_snapshots(path):
+    """
+    Records from one snapshot file or every *.jsonl.gz under a directory, oldest first.
+    A file cut off mid-write (recorder killed, or one written before per-record members)
+    contributes the records before the break.
+    """
+    files = sorted(glob.glob(os.path.join(path, "*.jsonl.gz"))) if os.path.isdir(path) else [path]
+    recs = []
+    for f in files:
+        n = len(recs)
+        try:
+            with gzip.open(f, "rt", encoding="utf-8") as fh:
+                for line in fh:
+                    if line.strip():
+                        recs.append(json.loads(line))
+        except (EOFError, zlib.error, gzip.BadGzipFile, json.JSONDecodeError) as e:
+            print(f"[WARN] {f}: truncated recording, kept {len(recs) - n} records ({e})")
+    recs.sort(key=lambda r: r["ts"])
+    return recs
+
+
+class ReplayProvider(MarketDataProvider):
+    """
+    Serves recorded responses without touching the network.
+    speed=None  -> step mode: each call returns the next recording for that (kind, symbol),
+                   so a given call sequence always sees the same data regardless of wall time.
+    speed=1.0   -> real time; speed=60 plays one recorded minute per wall second.
+    Payloads are shared between callers and must be treated as read-only.
+    """
+    name = "replay"
+
+    def __init__(self, path, speed=None, loop=True, clock=time.monotonic):
+        recs = load_snapshots(path)
+        if not recs:
+            raise ValueError(f"No snapshots found in {path}")
+        self.speed = speed
+        self.loop = loop
+        self.clock = clock
+        self.t_first = recs[0]["ts"]
+        self.t_last = recs[-1]["ts"]
+        self._series = {}
+        for r in recs:
+            ts, payloads = self._series.setdefault((r["kind"], r.get("symbol")), ([], []))
+            ts.append(r["ts"])
+            payloads.append(r["payload"])
+        self._cursor = {}
+        self._lock = threading.Lock()
+        self._t0 = clock()
+
+    def reset(self):
+        with self._lock:
+            self._cursor.clear()
+            self._t0 = self.clock()
+
+    def _virtual_ts(self):
+        elapsed = (self.clock() - self._t0) * self.speed
+        span_s = self.t_last - self.t_first
+        if self.loop and span_s > 0:
+            elapsed %= span_s
+        return self.t_first + elapsed
+
+    def _next(self, kind, symbol=None, advance=True):
+        """Next recording for (kind, symbol); advance=False peeks at the one last served (or the first)."""
+        series = self._series.get((kind, symbol))
+        if not series:
+            return None, False
+        ts, payloads = series
+        if self.speed is None:
+            with self._lock:
+                i = self._cursor.get((kind, symbol), 0)
+                if not advance:
+                    i = max(0, i - 1)
+                elif i >= len(payloads):
+                    i = 0 if self.loop else len(payloads) - 1
+                if advance:
+                    self._cursor[(kind, symbol)] = i + 1
+        else:
+            i = max(0, bisect.bisect_right(ts, self._virtual_ts()) - 1)
+        return payloads[i], True
+
+    def indices(self):
+        payload, found = self._next("indices")
+        return payload if found else {"INDIAVIX": 14.0}
+
+    def spot(self, symbol):
+        sym = symbol.upper()
+        payload, found = self._next("spot", sym)
+        if found and payload:
+            return payload
+        # fallbacks peek so the indices / chain sequences stay independent of spot() calls
+        idx, found = self._next("indices", advance=False)
+        if found and idx.get(sym):
+            return idx[sym]
+        oc, found = self._next("option_chain", sym, advance=False)
+        return (oc or {}).get("records", {}).get("underlyingValue") if found else None
+
+    def option_chain(self, symbol):
+        payload, found = self._next("option_chain", symbol.upper())
+        return payload if found else EMPTY_CHAIN
+
+
+# -------------------------------------------------------------
+# Factory
+# -------------------------------------------------------------
+def get_provider(kind=None, record=None, **kwargs):
+    """
+    Build a provider from arguments or env:
+      MARKET_DATA_PROVIDER = nse | kite | replay
+      MARKET_DATA_REPLAY   = snapshot file/dir, MARKET_DATA_REPLAY_SPEED = float (unset -> step mode)
+      KITE_API_KEY / KITE_ACCESS_TOKEN for kite
+      MARKET_DATA_RECORD   = directory to record live responses into
+    """
+    kind = (kind or os.getenv("MARKET_DATA_PROVIDER", "nse")).lower()
+    if kind == "replay":
+        speed = kwargs.get("speed", os.getenv("MARKET_DATA_REPLAY_SPEED"))
+        return ReplayProvider(kwargs.get("path") or os.getenv("MARKET_DATA_REPLAY", os.path.join("data", "recordings")),
+                              speed=float(speed) if speed else None, loop=kwargs.get("loop", True))
+    if kind == "kite":
+        provider = KiteQuoteProvider(kwargs.get("api_key") or os.getenv("KITE_API_KEY"),
+                                     kwargs.get("access_token") or os.getenv("KITE_ACCESS_TOKEN"))
+    else:
+        provider = NSEProvider()
+    record = record or os.getenv("MARKET_DATA_RECORD")
+    if record:
+        provider = RecordingProvider(provider, record if isinstance(record, str) else os.path.join("data", "recordings"))
+    return provider
+
+
+# -------------------------------------------------------------
+# CLI: record live data / load-test against a recording
+#   python -m modules.market_data record NIFTY BANKNIFTY --interval 60
+#   python -m modules.market_data replay data/recordings NIFTY --calls 10000
+# -------------------------------------------------------------
+def _main(argv=None):
+    import argparse
+    from .analytics import parse_chain, compute_atm_iv
+
+    ap = argparse.ArgumentParser(prog="python -m modules.market_data")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    rec = sub.add_parser("record")
+    rec.add_argument("symbols", nargs="+")
+    rec.add_argument("--provider", default="nse")
+    rec.add_argument("--out", default=os.path.join("data", "recordings"))
+    rec.add_argument("--interval", type=float, default=60.0)
+    rec.add_argument("--count", type=int, default=0, help="refresh cycles (0 = until interrupted)")
+    rep = sub.add_parser("replay")
+    rep.add_argument("path")
+    rep.add_argument("symbols", nargs="+")
+    rep.add_argument("--calls", type=int, default=1000)
+    rep.add_argument("--speed", type=float, default=None)
+    args = ap.parse_args(argv)
+
+    if args.cmd == "record":
+        provider = get_provider(args.provider, record=args.out)
+        n = 0
+        try:
+            while not args.count or n < args.count:
+                jobs = [provider.indices] + [lambda s=s: provider.spot(s) for s in args.symbols] \
+                    + [lambda s=s: provider.option_chain(s) for s in args.symbols]
+                for job in jobs:
+                    try:
+                        job()
+                    except FetchError as e:
+                        print(f"[WARN] {e}")
+                n += 1
+                print(f"[record] cycle {n} -> {provider.path}")
+                time.sleep(args.interval)
+        finally:
+            provider.close()
+        return
+
+    provider = ReplayProvider(args.path, speed=args.speed)
+    t0 = time.perf_counter()
+    for i in range(args.calls):
+        s = args.symbols[i % len(args.symbols)]
+        spot = provider.spot(s)
+        base = parse_chain(provider.option_chain(s))
+        compute_atm_iv(base.get("strike_iv"), spot, 100)
+    el = time.perf_counter() - t0
+    print(f"[replay] {args.calls} refreshes in {el:.2f}s ({args.calls / el:,.0f}/s)")
+
+
+if __name__ == "__main__":
+    _main()
@@ -1,7 +1,9 @@
 import datetime
 from kiteconnect import KiteConnect
+from .perf_trace import traced
 
 # ---------------- Zerodha Order ----------------
+@traced()
 def place_order_zerodha(api_key, access_token, symbol, strike, opt_type, expiry, qty, price, product="NRML"):
     """
     Places order on Zerodha via KiteConnect.
@@ -28,6 +30,7 @@ def place_order_zerodha(api_key, access_token, symbol, strike, opt_type, expiry,
 
 
 # ---------------- Groww Order (Simulated) ----------------
+@traced()
 def place_order_groww(symbol, strike, opt_type, expiry, qty, price, product="NRML"):
     """
     Simulated Groww order (Groww does not expose a public API).
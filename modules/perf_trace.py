@@ -0,0 +1,191 @@
+import os, time, json, threading, functools
+from collections import deque
+
+# -------------------------------------------------------------
+# Lightweight stage tracing
+# -------------------------------------------------------------
+# Spans record duration, payload size and cache hits into a bounded ring
+# buffer. With tracing disabled span() hands back a shared no-op object and
+# traced() falls straight through to the wrapped function.
+
+_ENABLED = os.getenv("PERF_TRACE", "").lower() in ("1", "true", "yes", "on")
+_BUFFER = deque(maxlen=int(os.getenv("PERF_TRACE_BUFFER", "2000")))
+_TOTALS = {}  # stage -> monotonic [count, seconds, bytes, cache_hits, errors]; survives eviction and clear()
+_LOCK = threading.Lock()
+
+PROM_PREFIX = "optiontrading_stage"
+
+
+def enable(on=True):
+    global _ENABLED
+    _ENABLED = bool(on)
+
+
+def disable():
+    enable(False)
+
+
+def is_enabled():
+    return _ENABLED
+
+
+def clear():
+    """Empty the ring buffer (the Prometheus counters keep counting)."""
+    with _LOCK:
+        _BUFFER.clear()
+
+
+class _NullSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+    def set(self, **attrs):
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class Span:
+    __slots__ = ("stage", "attrs", "t0")
+
+    def __init__(self, stage, attrs):
+        self.stage = stage
+        self.attrs = attrs
+        self.t0 = 0.0
+
+    def __enter__(self):
+        self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        ms = (time.perf_counter() - self.t0) * 1000.0
+        rec = {"ts": round(time.time(), 3), "stage": self.stage, "ms": round(ms, 3), "ok": exc_type is None}
+        rec.update(self.attrs)
+        with _LOCK:
+            _BUFFER.append(rec)
+            tot = _TOTALS.setdefault(self.stage, [0, 0.0, 0, 0, 0])
+            tot[0] += 1
+            tot[1] += ms / 1000.0
+            tot[2] += rec.get("bytes", 0) or 0
+            tot[3] += 1 if rec.get("cache_hit") else 0
+            tot[4] += 0 if rec["ok"] else 1
+        return False
+
+    def set(self, **attrs):
+        """Attach attributes (bytes=..., cache_hit=..., rows=...) to the span."""
+        self.attrs.update(attrs)
+
+
+def span(stage, **attrs):
+    """Context manager timing one stage: `with span("nse.indices") as sp: ...`."""
+    if not _ENABLED:
+        return _NULL_SPAN
+    return Span(stage, attrs)
+
+
+def traced(stage=None):
+    """Decorator form of span(); stage defaults to `<module>.<function>`."""
+    def deco(fn):
+        name = stage or f"{fn.__module__.rsplit('.', 1)[-1]}.{fn.__name__}"
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not _ENABLED:
+                return fn(*args, **kwargs)
+            with Span(name, {}):
+                return fn(*args, **kwargs)
+        return wrapper
+    return deco
+
+
+def payload_bytes(resp):
+    """Size of an HTTP response body (or bytes/str) without re-reading it."""
+    try:
+        body = getattr(resp, "content", resp)
+        return len(body) if body is not None else 0
+    except Exception:
+        return 0
+
+# -------------------------------------------------------------
+# Reading and exporting
+# -------------------------------------------------------------
+def records(last=None):
+    with _LOCK:
+        recs = list(_BUFFER)
+    return recs[-last:] if last else recs
+
+
+def _quantile(sorted_vals, q):
+    if not sorted_vals:
+        return 0.0
+    i = min(len(sorted_vals) - 1, max(0, int(round(q * (len(sorted_vals) - 1)))))
+    return sorted_vals[i]
+
+
+def summary():
+    """Per-stage aggregates over the ring buffer, slowest total first."""
+    stages = {}
+    for r in records():
+        stages.setdefault(r["stage"], []).append(r)
+    rows = []
+    for stage, recs in stages.items():
+        ms = sorted(r["ms"] for r in recs)
+        rows.append({
+            "stage": stage,
+            "count": len(recs),
+            "total_ms": round(sum(ms), 2),
+            "mean_ms": round(sum(ms) / len(ms), 2),
+            "p50_ms": round(_quantile(ms, 0.5), 2),
+            "p95_ms": round(_quantile(ms, 0.95), 2),
+            "max_ms": round(ms[-1], 2),
+            "bytes": sum(r.get("bytes", 0) or 0 for r in recs),
+            "cache_hits": sum(1 for r in recs if r.get("cache_hit")),
+            "errors": sum(1 for r in recs if not r.get("ok", True)),
+        })
+    return sorted(rows, key=lambda r: r["total_ms"], reverse=True)
+
+
+def export_jsonl(path=None):
+    """Return the buffer as JSON lines; append to `path` when given."""
+    text = "".join(json.dumps(r, default=str) + "\n" for r in records())
+    if path:
+        with open(path, "a") as f:
+            f.write(text)
+    return text
+
+
+def export_prometheus():
+    """
+    Prometheus text exposition. Quantiles cover the ring buffer; _sum, _count and
+    the *_total counters are process-lifetime totals, so rate()/increase() hold.
+    """
+    p = PROM_PREFIX
+    with _LOCK:
+        totals = {stage: list(t) for stage, t in _TOTALS.items()}
+    quantiles = {r["stage"]: r for r in summary()}
+    lines = [
+        f"# HELP {p}_duration_seconds Stage latency (quantiles over the trace buffer).",
+        f"# TYPE {p}_duration_seconds summary",
+    ]
+    for stage, (count, seconds, _, _, _) in sorted(totals.items()):
+        lbl = f'stage="{stage}"'
+        q = quantiles.get(stage)
+        if q:
+            lines.append(f'{p}_duration_seconds{{{lbl},quantile="0.5"}} {q["p50_ms"] / 1000.0:.6f}')
+            lines.append(f'{p}_duration_seconds{{{lbl},quantile="0.95"}} {q["p95_ms"] / 1000.0:.6f}')
+        lines.append(f'{p}_duration_seconds_sum{{{lbl}}} {seconds:.6f}')
+        lines.append(f'{p}_duration_seconds_count{{{lbl}}} {count}')
+    for metric, i, help_ in (("payload_bytes_total", 2, "Payload bytes seen by the stage."),
+                             ("cache_hits_total", 3, "Cache hits recorded by the stage."),
+                             ("errors_total", 4, "Spans that exited with an exception.")):
+        lines.append(f"# HELP {p}_{metric} {help_}")
+        lines.append(f"# TYPE {p}_{metric} counter")
+        for stage, t in sorted(totals.items()):
+            lines.append(f'{p}_{metric}{{stage="{stage}"}} {t[i]}')
+    return "\n".join(lines) + "\n"
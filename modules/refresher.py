@@ -0,0 +1,117 @@
+import os, time, signal
+
+from .market_data import get_provider
+from .resilience import ResilientFetcher
+from .analytics import compute_core_metrics
+from .chain_columns import columns_digest
+from .shm_snapshot import SnapshotWriter, default_root
+from .perf_trace import span
+
+# -------------------------------------------------------------
+# Background refresher: one fetch + analytics loop for every app session
+# -------------------------------------------------------------
+#   python -m modules.refresher NIFTY BANKNIFTY RELIANCE --interval 30
+#
+# Each cycle fetches the watchlist through a ResilientFetcher, recomputes
+# compute_core_metrics only when a symbol's inputs changed, and publishes the
+# columnar chain plus metrics to modules.shm_snapshot. Streamlit sessions attach
+# with SnapshotReader, so NSE traffic is one refresher's worth regardless of users.
+
+
+class Refresher:
+    def __init__(self, symbols, provider=None, root=None, r=0.07, days=15, budget=8.0):
+        self.symbols = [s.upper() for s in symbols]
+        self.fetcher = ResilientFetcher(provider or get_provider(), columnar=True)
+        self.root = root or default_root()
+        self.r, self.days, self.budget = r, days, budget
+        self.writers = {s: SnapshotWriter(s, self.root) for s in self.symbols}
+        self._last = {}
+
+    def refresh(self, symbol):
+        """Fetch and publish one symbol; returns True when a new snapshot was published."""
+        snap = self.fetcher.snapshot(symbol, budget=self.budget)
+        indices = snap["indices"].value or {}
+        spot = snap["spot"].value
+        vix = indices.get("INDIAVIX") or indices.get("INDIA VIX")
+        cols = snap["option_chain"].value
+        if not (spot and vix and cols):
+            missing = [name for name, res in snap.items() if not res.value]
+            print(f"[WARN] refresher {symbol}: no data for {', '.join(missing)}")
+            return False
+
+        key = (columns_digest(cols), spot, vix)
+        if self._last.get(symbol) == key:
+            return False
+        with span("refresher.compute", symbol=symbol):
+            metrics = compute_core_metrics(symbol, spot, vix, cols, r=self.r, days=self.days)
+        extra = {
+            "spot": spot,
+            "vix": vix,
+            "provider": getattr(self.fetcher.provider, "name", "?"),
+            "stale": {name: res.stale for name, res in snap.items()},
+            "fetched_at": {name: res.fetched_at for name, res in snap.items()},
+            "r": self.r,
+            "days": self.days,
+        }
+        self.writers[symbol].publish(cols, metrics, extra)
+        self._last[symbol] = key
+        return True
+
+    def _refresh_guarded(self, symbol):
+        # one symbol's bad chain (or a full disk) must not stop the rest of the watchlist
+        try:
+            return self.refresh(symbol)
+        except Exception as e:
+            print(f"[WARN] refresher {symbol}: {type(e).__name__}: {e}")
+            return False
+
+    def run(self, interval=30.0, cycles=0):
+        n = 0
+        while not cycles or n < cycles:
+            t0 = time.monotonic()
+            published = [s for s in self.symbols if self._refresh_guarded(s)]
+            n += 1
+            print(f"[refresher] cycle {n}: published {', '.join(published) or 'nothing new'} "
+                  f"in {time.monotonic() - t0:.2f}s -> {self.root}")
+            time.sleep(max(0.0, interval - (time.monotonic() - t0)))
+
+    def close(self):
+        for w in self.writers.values():
+            w.close()
+        close = getattr(self.fetcher.provider, "close", None)
+        if close:
+            close()
+
+
+def _stop(*_):
+    raise KeyboardInterrupt
+
+
+def _main(argv=None):
+    import argparse
+
+    ap = argparse.ArgumentParser(prog="python -m modules.refresher")
+    ap.add_argument("symbols", nargs="*", default=os.getenv("REFRESHER_SYMBOLS", "NIFTY,BANKNIFTY").split(","))
+    ap.add_argument("--provider", default=None, help="nse | kite | replay (default: MARKET_DATA_PROVIDER)")
+    ap.add_argument("--replay", default=None, help="snapshot file/dir for --provider replay")
+    ap.add_argument("--record", default=None, help="also record responses into this directory")
+    ap.add_argument("--root", default=None, help="snapshot directory (default: SNAPSHOT_DIR or /dev/shm/optiontrading)")
+    ap.add_argument("--interval", type=float, default=30.0)
+    ap.add_argument("--cycles", type=int, default=0, help="refresh cycles (0 = until interrupted)")
+    ap.add_argument("--rate", type=float, default=0.07, help="risk-free rate")
+    ap.add_argument("--days", type=int, default=15, help="days to expiry estimate")
+    args = ap.parse_args(argv)
+
+    provider = get_provider(args.provider, record=args.record, path=args.replay)
+    refresher = Refresher(args.symbols, provider, root=args.root, r=args.rate, days=args.days)
+    signal.signal(signal.SIGTERM, _stop)
+    try:
+        refresher.run(args.interval, args.cycles)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        refresher.close()
+
+
+if __name__ == "__main__":
+    _main()
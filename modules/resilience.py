@@ -0,0 +1,194 @@
+import time, random, threading
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+
+from .perf_trace import span
+
+# -------------------------------------------------------------
+# Errors, retry policies and circuit breakers
+# -------------------------------------------------------------
+class FetchError(Exception):
+    """A market-data source failed or returned an unusable payload."""
+
+
+class CircuitOpenError(FetchError):
+    """The endpoint's circuit breaker is open; the call was not attempted."""
+
+
+class RetryPolicy:
+    """Exponential backoff with full jitter: attempt i sleeps U(0, min(cap, base * 2**i))."""
+
+    def __init__(self, attempts=3, base=0.25, cap=2.0):
+        self.attempts, self.base, self.cap = attempts, base, cap
+
+    def delay(self, attempt):
+        return random.uniform(0.0, min(self.cap, self.base * (2 ** attempt)))
+
+
+class CircuitBreaker:
+    """
+    closed -> open after `failure_threshold` consecutive failures; open rejects calls
+    for `reset_after` seconds, then half-open lets one probe through.
+    """
+
+    def __init__(self, name, failure_threshold=3, reset_after=30.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_after = reset_after
+        self.failures = 0
+        self.opened_at = None
+        self._probe = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return "closed"
+        return "half-open" if time.monotonic() - self.opened_at >= self.reset_after else "open"
+
+    def allow(self):
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            if time.monotonic() - self.opened_at < self.reset_after or self._probe:
+                return False
+            self._probe = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self.failures, self.opened_at, self._probe = 0, None, False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self._probe or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+            self._probe = False
+
+
+POLICIES = {
+    "indices": RetryPolicy(attempts=3, base=0.25, cap=2.0),
+    "spot": RetryPolicy(attempts=3, base=0.25, cap=2.0),
+    "option_chain": RetryPolicy(attempts=4, base=0.5, cap=4.0),
+}
+DEFAULT_POLICY = RetryPolicy()
+
+_BREAKERS = {}
+_BREAKERS_LOCK = threading.Lock()
+
+
+def breaker(name, **kwargs):
+    """Shared circuit breaker per endpoint name (e.g. "nse.option_chain")."""
+    with _BREAKERS_LOCK:
+        if name not in _BREAKERS:
+            _BREAKERS[name] = CircuitBreaker(name, **kwargs)
+        return _BREAKERS[name]
+
+
+def breaker_states():
+    with _BREAKERS_LOCK:
+        return {name: b.state for name, b in _BREAKERS.items()}
+
+
+def call_with_retry(fn, policy=DEFAULT_POLICY, validate=None, name="call"):
+    """Run fn() under `policy`; raises the last FetchError once attempts are exhausted."""
+    last = None
+    for attempt in range(policy.attempts):
+        try:
+            with span("retry.attempt", component=name, attempt=attempt + 1):
+                value = fn()
+            if validate is not None and not validate(value):
+                raise FetchError(f"{name}: incomplete payload")
+            return value
+        except CircuitOpenError:
+            raise
+        except Exception as e:
+            last = e if isinstance(e, FetchError) else FetchError(f"{name}: {e}")
+        if attempt + 1 < policy.attempts:
+            time.sleep(policy.delay(attempt))
+    raise last
+
+
+# -------------------------------------------------------------
+# Per-component fetch with stale fallback
+# -------------------------------------------------------------
+FetchResult = namedtuple("FetchResult", ["value", "stale", "fetched_at", "error"])
+
+
+class ResilientFetcher:
+    """
+    Wraps a MarketDataProvider. Each component (indices, spot, option_chain) is
+    fetched on a worker pool under its own retry policy; callers wait at most
+    `budget` seconds. If the fetch is still retrying or failed, the last good
+    value is returned with stale=True while the retry finishes in the background.
+    """
+
+    def __init__(self, provider, policies=None, workers=6, columnar=False):
+        self.provider = provider
+        self.columnar = columnar  # option_chain as chain_columns arrays (provider.option_chain_columns)
+        self.policies = dict(POLICIES, **(policies or {}))
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="fetch")
+        self._inflight = {}
+        self._good = {}
+        self._lock = threading.Lock()
+
+    def _run(self, key, fn, validate):
+        value = call_with_retry(fn, self.policies.get(key[0], DEFAULT_POLICY), validate, name=key[0])
+        with self._lock:
+            self._good[key] = (value, time.time())
+        return value
+
+    def submit(self, component, symbol, fn, validate=None):
+        """Start (or join) the refresh for one component; never more than one in flight per key."""
+        key = (component, symbol)
+        with self._lock:
+            fut = self._inflight.get(key)
+            if fut is None or fut.done():
+                fut = self._pool.submit(self._run, key, fn, validate)
+                self._inflight[key] = fut
+        return key, fut
+
+    def result(self, key, fut, deadline):
+        try:
+            value = fut.result(timeout=max(0.0, deadline - time.monotonic()))
+            with self._lock:
+                return FetchResult(value, False, self._good[key][1], None)
+        except FutureTimeout:
+            error = "still retrying"
+        except Exception as e:
+            error = str(e)[:150]
+        with self._lock:
+            good = self._good.get(key)
+        if good is None:
+            return FetchResult(None, True, None, error)
+        return FetchResult(good[0], True, good[1], error)
+
+    def snapshot(self, symbol, budget=4.0, index_symbols=("NIFTY", "BANKNIFTY")):
+        """
+        Fetch indices, spot and chain concurrently within `budget` seconds.
+        Returns {"indices": FetchResult, "spot": FetchResult, "option_chain": FetchResult}.
+        Index spots come from the indices payload (or the chain's underlying) instead of a separate call.
+        """
+        sym = symbol.upper()
+        deadline = time.monotonic() + budget
+        p = self.provider
+        if self.columnar:
+            chain = self.submit("option_chain", sym, lambda: p.option_chain_columns(sym),
+                                validate=lambda cols: bool(len(cols["strike"])))
+        else:
+            chain = self.submit("option_chain", sym, lambda: p.option_chain(sym),
+                                validate=lambda oc: bool((oc or {}).get("records", {}).get("data")))
+        jobs = {"indices": self.submit("indices", None, p.indices, validate=bool), "option_chain": chain}
+        if sym not in index_symbols:
+            jobs["spot"] = self.submit("spot", sym, lambda: p.spot(sym), validate=bool)
+        with span("fetch.snapshot", symbol=sym):
+            out = {name: self.result(key, fut, deadline) for name, (key, fut) in jobs.items()}
+        if "spot" not in out:
+            idx, oc = out["indices"], out["option_chain"]
+            chain_spot = (oc.value or {}).get("underlying") if self.columnar \
+                else (oc.value or {}).get("records", {}).get("underlyingValue")
+            spot = (idx.value or {}).get(sym) or chain_spot
+            src = idx if (idx.value or {}).get(sym) else oc
+            out["spot"] = FetchResult(spot, src.stale, src.fetched_at, src.error if not spot else None)
+        return out
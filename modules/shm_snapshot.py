@@ -0,0 +1,241 @@
+import os, json, mmap, struct, time
+import numpy as np
+
+from .chain_columns import FIELDS
+from .analytics import metrics_to_json, metrics_from_json
+from .perf_trace import span
+
+# -------------------------------------------------------------
+# Shared-memory chain snapshots
+# -------------------------------------------------------------
+# One memory-mapped file per symbol, written by a single refresher process and
+# read by any number of app sessions without locks:
+#
+#   header  : magic | hseq | version | active slot | slot size | row capacity | meta capacity
+#   slot 0  : seq | version | rows | meta length | published_at | f8 columns | i4 columns | meta JSON
+#   slot 1  : (same)
+#
+# Both the header and each slot are seqlocks: the writer makes the sequence odd,
+# writes, then makes it even again. The writer fills the inactive slot, then
+# flips `active` / `version` under the header seqlock. Readers take a consistent
+# (version, active) pair, copy the slot's columns and metadata out, and retry if
+# the slot's seq moved meanwhile; the snapshot a session renders is therefore
+# its own copy and stays valid however fast the refresher (or a replay) publishes.
+# Each reader copies once per published version and reuses it across reruns.
+
+MAGIC = b"OTSNAP02"
+HEADER = struct.Struct("<8sQQQQQQ")
+SLOT_HEADER = struct.Struct("<QQQd")
+HEADER_SIZE = 64
+SLOT_HEADER_SIZE = 64
+F8_COLUMNS = ("strike",) + FIELDS
+I4_COLUMNS = ("expiry_idx", "side")
+DEFAULT_ROWS = 8192
+DEFAULT_META = 512 * 1024
+_SEQ = struct.Struct("<Q")
+
+
+def default_root():
+    root = os.getenv("SNAPSHOT_DIR")
+    if root:
+        return root
+    return "/dev/shm/optiontrading" if os.path.isdir("/dev/shm") else os.path.join("data", "shm")
+
+
+def snapshot_path(symbol, root=None):
+    return os.path.join(root or default_root(), f"{symbol.upper()}.snap")
+
+
+def _slot_size(rows, meta):
+    size = SLOT_HEADER_SIZE + rows * (8 * len(F8_COLUMNS) + 4 * len(I4_COLUMNS)) + meta
+    return (size + 63) // 64 * 64
+
+
+def _layout(rows):
+    """Byte offsets of each column inside a slot."""
+    off, out = SLOT_HEADER_SIZE, {}
+    for c in F8_COLUMNS:
+        out[c] = (off, np.float64)
+        off += rows * 8
+    for c in I4_COLUMNS:
+        out[c] = (off, np.int32)
+        off += rows * 4
+    out["meta"] = (off, None)
+    return out
+
+
+class SnapshotWriter:
+    """Single-writer publisher for one symbol (used by modules.refresher)."""
+
+    def __init__(self, symbol, root=None, rows=DEFAULT_ROWS, meta_bytes=DEFAULT_META):
+        self.symbol = symbol.upper()
+        self.path = snapshot_path(self.symbol, root)
+        self.version = 0
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self._create(rows, meta_bytes)
+
+    def _create(self, rows, meta_bytes):
+        # built under a temporary name and renamed over the live file only after the
+        # first publish into it, so readers never map a file with nothing in it
+        slot = _slot_size(rows, meta_bytes)
+        self._pending = self.path + ".tmp"
+        with open(self._pending, "wb") as f:
+            f.truncate(HEADER_SIZE + 2 * slot)
+            f.write(HEADER.pack(MAGIC, 0, 0, 1, slot, rows, meta_bytes))
+        self._fh = open(self._pending, "r+b")
+        self._mm = mmap.mmap(self._fh.fileno(), 0)
+        self.rows, self.meta_bytes, self.slot = rows, meta_bytes, slot
+        self._active = 1
+        self._cols = _layout(rows)
+
+    def publish(self, cols, metrics, extra=None):
+        """Publish chain columns (chain_columns layout) plus metrics; returns the new version."""
+        n = len(cols["strike"])
+        expiries = sorted(set(cols["expiry"].tolist()))
+        meta = json.dumps({
+            "symbol": self.symbol,
+            "expiries": expiries,
+            "underlying": cols.get("underlying"),
+            "timestamp": cols.get("timestamp"),
+            "extra": extra or {},
+            "metrics": metrics_to_json(metrics),
+        }, default=float).encode()
+        if n > self.rows or len(meta) > self.meta_bytes:
+            # readers notice the new inode and remap; the version keeps counting across files
+            self.close()
+            self._create(max(n * 2, self.rows), max(len(meta) * 2, self.meta_bytes))
+
+        with span("shm.publish", symbol=self.symbol, rows=n) as sp:
+            mm = self._mm
+            version = self.version + 1
+            target = 1 - self._active
+            base = HEADER_SIZE + target * self.slot
+            seq = _SEQ.unpack_from(mm, base)[0]
+            _SEQ.pack_into(mm, base, seq + 1)  # odd: slot write in progress
+
+            lookup = {e: i for i, e in enumerate(expiries)}
+            data = {c: cols[c] for c in F8_COLUMNS}
+            data["expiry_idx"] = np.fromiter((lookup[e] for e in cols["expiry"].tolist()), dtype=np.int32, count=n)
+            data["side"] = cols["side"]
+            for c, (off, dtype) in self._cols.items():
+                if dtype is not None:
+                    np.frombuffer(mm, dtype=dtype, count=n, offset=base + off)[:] = data[c]
+            meta_off = base + self._cols["meta"][0]
+            mm[meta_off:meta_off + len(meta)] = meta
+            SLOT_HEADER.pack_into(mm, base + 8, version, n, len(meta), time.time())
+            _SEQ.pack_into(mm, base, seq + 2)
+
+            hseq = _SEQ.unpack_from(mm, 8)[0]
+            _SEQ.pack_into(mm, 8, hseq + 1)  # odd: header update in progress
+            HEADER.pack_into(mm, 0, MAGIC, hseq + 1, version, target, self.slot, self.rows, self.meta_bytes)
+            _SEQ.pack_into(mm, 8, hseq + 2)
+            self.version, self._active = version, target
+            if self._pending:
+                os.replace(self._pending, self.path)
+                self._pending = None
+            sp.set(bytes=n * (8 * len(F8_COLUMNS) + 4 * len(I4_COLUMNS)) + len(meta))
+        return version
+
+    def close(self):
+        self._mm.close()
+        self._fh.close()
+        if self._pending:
+            os.remove(self._pending)
+            self._pending = None
+
+
+class SharedSnapshot:
+    """One published version, copied out of the shared slot (arrays are private to this reader)."""
+
+    def __init__(self, version, published_at, columns, meta):
+        self.version, self.published_at = version, published_at
+        self.columns = columns
+        self.meta = meta
+        self._metrics = None
+
+    @property
+    def metrics(self):
+        if self._metrics is None:
+            self._metrics = metrics_from_json(self.meta["metrics"])
+        return self._metrics
+
+    @property
+    def age(self):
+        return time.time() - self.published_at
+
+    def chain_columns(self):
+        """chain_columns-style dict with the expiry strings materialised."""
+        cols = {c: self.columns[c] for c in F8_COLUMNS}
+        cols["expiry"] = np.asarray(self.meta["expiries"] or [""], dtype="U11")[self.columns["expiry_idx"]]
+        cols["side"] = self.columns["side"]
+        cols["underlying"] = self.meta.get("underlying")
+        cols["timestamp"] = self.meta.get("timestamp")
+        return cols
+
+
+class SnapshotReader:
+    """Lock-free reader for one symbol; cheap enough to call on every Streamlit rerun."""
+
+    def __init__(self, symbol, root=None):
+        self.symbol = symbol.upper()
+        self.path = snapshot_path(self.symbol, root)
+        self._mm = None
+        self._ino = None
+        self._last = None
+        self._last_key = None
+
+    def _attach(self):
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        if self._mm is None or st.st_ino != self._ino:
+            if self._mm is not None:
+                self._mm.close()  # snapshots are copies, nothing still points into it
+            with open(self.path, "rb") as f:
+                self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            self._ino = st.st_ino
+        return self._mm
+
+    @staticmethod
+    def _header(mm):
+        """Consistent (magic, version, active, slot, rows) or None while the writer is mid-update."""
+        h = HEADER.unpack_from(mm, 0)
+        if h[1] % 2 or _SEQ.unpack_from(mm, 8)[0] != h[1]:
+            return None
+        return (h[0],) + h[2:6]
+
+    def read(self, attempts=50):
+        """Latest consistent snapshot, or None if nothing has been published yet."""
+        for attempt in range(attempts):
+            if attempt:
+                time.sleep(0.001)
+            mm = self._attach()
+            if mm is None or len(mm) < HEADER_SIZE:
+                return None
+            header = self._header(mm)
+            if header is None:
+                continue
+            magic, version, active, slot, rows = header
+            if magic != MAGIC:
+                return None
+            if not version:
+                return self._last  # nothing published into this file yet
+            if self._last_key == (self._ino, version):
+                return self._last
+            base = HEADER_SIZE + active * slot
+            seq = _SEQ.unpack_from(mm, base)[0]
+            if seq % 2:
+                continue
+            slot_version, n, meta_len, published_at = SLOT_HEADER.unpack_from(mm, base + 8)
+            layout = _layout(rows)
+            columns = {c: np.frombuffer(mm, dtype=dtype, count=n, offset=base + off).copy()
+                       for c, (off, dtype) in layout.items() if dtype is not None}
+            meta_off = base + layout["meta"][0]
+            meta = bytes(mm[meta_off:meta_off + meta_len])
+            if _SEQ.unpack_from(mm, base)[0] != seq:
+                continue  # the writer reused this slot while we copied
+            self._last = SharedSnapshot(slot_version, published_at, columns, json.loads(meta))
+            self._last_key = (self._ino, version)
+            return self._last
+        return None
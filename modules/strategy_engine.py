@@ -1,3 +1,6 @@
+import math
+from .greeks import d1_d2
+
 def build_strategies(symbol, oc, capital, risk_pct, metrics, r=0.07, days=7, focus="AI-Auto"):
     """
     Build option-selling strategies based on selected focus.
@@ -17,18 +20,39 @@ def build_strategies(symbol, oc, capital, risk_pct, metrics, r=0.07, days=7, foc
     if isinstance(metrics.get("expected_move_3d"), tuple):
         expected_move = metrics["expected_move_3d"][0] or 200
 
+    # Smile IVs at the strikes each structure actually sells (see modules/vol_surface.py)
+    surface = metrics.get("vol_surface")
+    T = max(days, 1) / 365.0
+    def smile_iv(*strikes, expiries=(None,)):
+        if not surface or not spot:
+            return "–"
+        return " / ".join(f"{surface.iv(k, T=T, expiry=e) * 100:.1f}%" for e in expiries for k in strikes)
+
+    # Risk-neutral P(S_T > K) with the smile IV at K, so POP reflects put skew at the short strikes
+    def prob_above(K):
+        sigma = surface.iv(K, T=T) if surface and spot and K > 0 else None
+        if not sigma:
+            return None
+        _, d2 = d1_d2(spot, K, r, 0.0, sigma, T)
+        return 0.5 * (1 + math.erf(d2 / math.sqrt(2)))
+
+    def win_pct(p, fallback):
+        return f"≈{p * 100:.0f}%" if p is not None else fallback
+
     strategies = []
 
     # 1️⃣ Iron Condor
     if focus in ["AI-Auto", "Iron Condor"]:
+        p_lo, p_hi = prob_above(spot - expected_move), prob_above(spot + expected_move)
         strategies.append({
             "Strategy": "Iron Condor",
             "Contracts": f"{symbol} ±{int(expected_move)} CE/PE",
             "Risk ₹": int(capital * (risk_pct / 100)),
             "Max Profit": "Credit received",
             "Max Loss": "Spread width - credit",
-            "Win%": "≈65%",
-            "Notes": "Neutral market, IV high"
+            "Win%": win_pct(p_lo - p_hi if p_lo is not None and p_hi is not None else None, "≈65%"),
+            "Notes": "Neutral market, IV high",
+            "Smile IV": smile_iv(spot - expected_move, spot + expected_move)
         })
 
     # 2️⃣ Credit Spread
@@ -39,8 +63,9 @@ def build_strategies(symbol, oc, capital, risk_pct, metrics, r=0.07, days=7, foc
             "Risk ₹": int(capital * (risk_pct / 100)),
             "Max Profit": "Credit",
             "Max Loss": "Width - credit",
-            "Win%": "≈70%",
-            "Notes": "Bullish bias, IV > 14"
+            "Win%": win_pct(prob_above(spot - 100), "≈70%"),
+            "Notes": "Bullish bias, IV > 14",
+            "Smile IV": smile_iv(spot - 100)
         })
 
     # 3️⃣ Calendar Spread
@@ -52,7 +77,8 @@ def build_strategies(symbol, oc, capital, risk_pct, metrics, r=0.07, days=7, foc
             "Max Profit": "Theta decay",
             "Max Loss": "Limited",
             "Win%": "≈55%",
-            "Notes": "Low IV, stable vols"
+            "Notes": "Low IV, stable vols",
+            "Smile IV": smile_iv(spot, expiries=surface.expiries[:2] if surface else (None,))
         })
 
     return strategies
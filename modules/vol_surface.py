@@ -0,0 +1,238 @@
+import math, threading, time, datetime as dt
+import numpy as np
+
+from .chain_columns import chain_to_columns, expiry_date
+from .greeks import greeks, implied_vol
+from .perf_trace import span, traced
+
+# -------------------------------------------------------------
+# SVI volatility smile / surface
+# -------------------------------------------------------------
+# Raw SVI per expiry in total variance w = iv^2 * T over log-moneyness k = ln(K/F):
+#   w(k) = a + b * (rho * (k - m) + sqrt((k - m)^2 + sigma^2))
+# Each smile is fitted with Levenberg-Marquardt over all strikes at once and
+# warm-started from the last fit cached per (symbol, expiry). Across expiries
+# total variance is interpolated linearly in T at fixed strike.
+
+YEAR_SECONDS = 365.0 * 86400
+EXPIRY_CLOSE = dt.time(15, 30)
+MIN_POINTS = 5
+
+_CACHE = {}
+_CACHE_LOCK = threading.Lock()
+
+
+def svi_total_variance(params, k):
+    a, b, rho, m, sig = params
+    x = np.asarray(k, dtype=np.float64) - m
+    return a + b * (rho * x + np.sqrt(x * x + sig * sig))
+
+
+def _svi_jacobian(params, k):
+    a, b, rho, m, sig = params
+    x = k - m
+    s = np.sqrt(x * x + sig * sig)
+    return np.column_stack([np.ones_like(k), rho * x + s, b * x, -b * (rho + x / s), b * sig / s])
+
+
+def _clamp(p):
+    a, b, rho, m, sig = p
+    return np.array([a, max(b, 1e-6), min(max(rho, -0.999), 0.999), m, max(sig, 1e-4)])
+
+
+def fit_svi(k, w, weights=None, init=None, max_iter=100, tol=1e-6, xtol=1e-6):
+    """
+    Levenberg-Marquardt fit of raw SVI to total variance; returns (params, rmse_in_w, iterations).
+    Stops once an accepted step improves the cost by less than `tol` (relative) or moves the
+    parameters by less than `xtol` (relative), so a warm start near the optimum takes a few iterations.
+    """
+    k = np.asarray(k, dtype=np.float64)
+    w = np.asarray(w, dtype=np.float64)
+    sw = np.sqrt(weights) if weights is not None else np.ones_like(w)
+    if init is None:
+        init = (max(w.min() * 0.9, 1e-6), 0.1, -0.3, 0.0, 0.1)
+    p = _clamp(np.asarray(init, dtype=np.float64))
+    r = (svi_total_variance(p, k) - w) * sw
+    cost = r @ r
+    lam = 1e-3
+    it = 0
+    for it in range(1, max_iter + 1):
+        J = _svi_jacobian(p, k) * sw[:, None]
+        g = J.T @ r
+        H = J.T @ J
+        improved = False
+        while lam < 1e10:
+            step = np.linalg.solve(H + lam * np.diag(np.diag(H) + 1e-12), -g)
+            p_new = _clamp(p + step)
+            r_new = (svi_total_variance(p_new, k) - w) * sw
+            cost_new = r_new @ r_new
+            if cost_new < cost:
+                improved = True
+                break
+            lam *= 10.0
+        if not improved:
+            break
+        done = (cost - cost_new <= tol * max(cost, 1e-16)
+                or np.linalg.norm(p_new - p) <= xtol * (np.linalg.norm(p) + xtol))
+        p, r, cost = p_new, r_new, cost_new
+        lam = max(lam / 10.0, 1e-12)
+        if done:
+            break
+    return p, math.sqrt(cost / max(sw @ sw, 1e-16)), it
+
+
+def year_fraction(expiry, now=None):
+    now = now or dt.datetime.now()
+    return (dt.datetime.combine(expiry_date(expiry), EXPIRY_CLOSE) - now).total_seconds() / YEAR_SECONDS
+
+
+class SmileFit:
+    __slots__ = ("expiry", "T", "forward", "params", "rmse", "iters", "n", "fitted_at")
+
+    def __init__(self, expiry, T, forward, params, rmse, iters, n, fitted_at=None):
+        self.expiry, self.T, self.forward = expiry, T, forward
+        self.params = np.asarray(params, dtype=np.float64)
+        self.rmse, self.iters, self.n = rmse, iters, n
+        self.fitted_at = fitted_at or time.time()
+
+    def iv(self, strike):
+        k = np.log(np.asarray(strike, dtype=np.float64) / self.forward)
+        return np.sqrt(np.maximum(svi_total_variance(self.params, k), 1e-12) / self.T)
+
+    def to_dict(self):
+        return {"expiry": self.expiry, "T": self.T, "forward": self.forward, "params": self.params.tolist(),
+                "rmse": self.rmse, "iters": self.iters, "n": self.n, "fitted_at": self.fitted_at}
+
+
+class VolSurface:
+    """Fitted smiles for one symbol; iv() interpolates across strikes (SVI) and tenors (total variance)."""
+
+    def __init__(self, symbol, spot, smiles, r=0.07, q=0.0):
+        self.symbol, self.spot, self.r, self.q = symbol, spot, r, q
+        self.smiles = sorted(smiles, key=lambda s: s.T)
+        self._by_expiry = {s.expiry: s for s in self.smiles}
+
+    def __bool__(self):
+        return bool(self.smiles)
+
+    @property
+    def expiries(self):
+        return [s.expiry for s in self.smiles]
+
+    def iv(self, strike, T=None, expiry=None):
+        """Annualised IV at strike(s) for a listed expiry or any tenor T (years); array in, array out."""
+        if not self.smiles:
+            return None
+        if expiry is not None and expiry in self._by_expiry:
+            out = self._by_expiry[expiry].iv(strike)
+            return out if np.ndim(out) else float(out)
+        if T is None:
+            T = self.smiles[0].T
+        Ts = [s.T for s in self.smiles]
+        if T <= Ts[0] or len(Ts) == 1:
+            out = self.smiles[0].iv(strike)
+        elif T >= Ts[-1]:
+            out = self.smiles[-1].iv(strike)
+        else:
+            j = int(np.searchsorted(Ts, T))
+            lo, hi = self.smiles[j - 1], self.smiles[j]
+            w_lo = lo.iv(strike) ** 2 * lo.T
+            w_hi = hi.iv(strike) ** 2 * hi.T
+            frac = (T - lo.T) / (hi.T - lo.T)
+            out = np.sqrt(np.maximum(w_lo + frac * (w_hi - w_lo), 1e-12) / T)
+        return out if np.ndim(out) else float(out)
+
+    def atm_iv(self, T=None, expiry=None):
+        return self.iv(self.spot, T=T, expiry=expiry)
+
+    def greeks(self, K, T, call=True, S=None):
+        """(delta, theta, vega) priced off the surface IV at K, T."""
+        sigma = self.iv(K, T=T)
+        return greeks(S or self.spot, K, self.r, self.q, sigma, T, call=call) if sigma else (None, None, None)
+
+    def implied_vol(self, price, K, T, call=True, S=None):
+        """IV solve warm-started from the surface."""
+        return implied_vol(price, S or self.spot, K, self.r, self.q, T, call=call, guess=self.iv(K, T=T))
+
+    def to_dict(self):
+        return {"symbol": self.symbol, "spot": self.spot, "r": self.r, "q": self.q,
+                "smiles": [s.to_dict() for s in self.smiles]}
+
+    @classmethod
+    def from_dict(cls, d):
+        smiles = [SmileFit(s["expiry"], s["T"], s["forward"], s["params"], s["rmse"], s["iters"], s["n"], s["fitted_at"])
+                  for s in d.get("smiles", [])]
+        return cls(d["symbol"], d["spot"], smiles, d.get("r", 0.07), d.get("q", 0.0))
+
+
+def _smile_points(cols, expiry, forward):
+    """OTM-side IVs per strike (puts below the forward, calls above), falling back to the other side."""
+    sel = (cols["expiry"] == expiry) & (cols["iv"] > 0)
+    strikes, sides, ivs = cols["strike"][sel], cols["side"][sel], cols["iv"][sel]
+    if not len(strikes):
+        return strikes, ivs
+    otm = np.where(strikes < forward, 1, 0)
+    order = np.lexsort((sides != otm, strikes))
+    strikes, ivs = strikes[order], ivs[order]
+    first = np.ones(len(strikes), dtype=bool)
+    first[1:] = strikes[1:] != strikes[:-1]
+    return strikes[first], ivs[first] / 100.0
+
+
+@traced()
+def fit_surface(symbol, oc, spot, r=0.07, q=0.0, now=None, max_iter=100):
+    """Fit every listed expiry of the chain, warm-starting from cached parameters."""
+    now = now or dt.datetime.now()
+    cols = oc if isinstance(oc, dict) and "strike" in oc else chain_to_columns(oc)
+    spot = spot or cols.get("underlying")
+    if not spot or not len(cols["strike"]):
+        return VolSurface(symbol, spot, [], r, q)
+    _live_fits(symbol, now)
+    smiles = []
+    for expiry in np.unique(cols["expiry"]).tolist():
+        T = year_fraction(expiry, now)
+        if T <= 0:
+            continue
+        F = spot * math.exp((r - q) * T)
+        strikes, ivs = _smile_points(cols, expiry, F)
+        if len(strikes) < MIN_POINTS:
+            continue
+        key = (symbol.upper(), expiry)
+        with _CACHE_LOCK:
+            prev = _CACHE.get(key)
+        with span("vol_surface.fit_expiry", symbol=symbol, expiry=expiry, cache_hit=prev is not None) as sp:
+            k = np.log(strikes / F)
+            w = ivs * ivs * T
+            # favour the body of the smile over illiquid far wings
+            weights = np.exp(-0.5 * (k / max(math.sqrt(T), 0.05)) ** 2) + 0.05
+            params, rmse, iters = fit_svi(k, w, weights, init=prev.params if prev is not None else None, max_iter=max_iter)
+            sp.set(rows=len(k), iters=iters)
+        fit = SmileFit(expiry, T, F, params, rmse, iters, len(k))
+        with _CACHE_LOCK:
+            _CACHE[key] = fit
+        smiles.append(fit)
+    return VolSurface(symbol, spot, smiles, r, q)
+
+
+def _live_fits(symbol, now):
+    """Cached fits for a symbol whose expiry is still ahead; expired ones are evicted."""
+    symbol = symbol.upper()
+    with _CACHE_LOCK:
+        for key in [key for key in _CACHE if key[0] == symbol and year_fraction(key[1], now) <= 0]:
+            del _CACHE[key]
+        return [f for (s, _), f in _CACHE.items() if s == symbol]
+
+
+def cached_surface(symbol, spot=None, r=0.07, q=0.0, now=None):
+    """
+    Surface from the last cached fits for a symbol (no refit). Expired expiries are dropped and
+    each smile is re-anchored to the current time to expiry, keeping its fitted IVs.
+    """
+    now = now or dt.datetime.now()
+    smiles = []
+    for f in _live_fits(symbol, now):
+        T = year_fraction(f.expiry, now)
+        scale = T / f.T  # w = iv^2 * T is linear in a and b
+        params = f.params * np.array([scale, scale, 1.0, 1.0, 1.0])
+        smiles.append(SmileFit(f.expiry, T, f.forward, params, f.rmse, f.iters, f.n, f.fitted_at))
+    return VolSurface(symbol, spot, smiles, r, q)